@@ -8,27 +8,52 @@ and contributor characteristics, such as top authors, ages, etc.
 #Import statements
 
 import sys
-import praw #PRAW is a Python Reddit API wrapper that streamlines the process
-            #of importing Reddit posts
-import nltk
-from nltk.corpus import stopwords
-from nltk.corpus import words as wordlist
+import os
+import argparse
+import csv
+import json
+import gzip
+import bz2
+import lzma
+import io
+import threading
+import sqlite3
+import zlib
+import mmap
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from datetime import datetime
+import calendar
+import contextlib
+import functools
+import heapq
+import time
 import re
-from collections import defaultdict
-from matplotlib import pyplot as plt
+from array import array
+from collections import Counter, defaultdict, namedtuple
 import texttable as tt
 
-cid = sys.argv[1]
-secret = sys.argv[2]
-agent = sys.argv[3]
+#PRAW (a Python Reddit API wrapper that streamlines the process of importing
+#Reddit posts), NLTK and matplotlib take seconds to import, so they're only
+#imported by the functions that use them, when they're first called: a run
+#on a dump with the fast tokenizer never imports PRAW or NLTK at all
 
-reddit = praw.Reddit(client_id=cid,
-                     client_secret=secret,
-                     user_agent=agent)
+#The Reddit client is only created when posts are fetched live (see the
+#bottom of this file); archived dumps can be analyzed without credentials.
+#redditSettings keeps the keyword arguments it was created with, so that
+#parallel fetch workers can create their own clients
+reddit = None
+redditSettings = {}
 
-wordList = set(word.lower() for word in wordlist.words())
-stopWords = set(stopwords.words('english'))
+#Reddit allows OAuth clients 100 API requests per minute; the parallel
+#fetch workers share this budget, with short bursts of up to 10 requests
+redditRate = 100/60.
+redditBurst = 10
+
+#English words and stopwords from NLTK, loaded by loadLexicon when they're 
+#first needed; lexiconPath is the frozen lexicon file to load them from
+wordList = None
+stopWords = None
+lexiconPath = None
 
 #Treatment dictionaries are included for 4 disease states to facilitate
 #analysis; the lists are not comprehensive, but cover several major and/or 
@@ -100,82 +125,1430 @@ CDtreatmentDict = {'Humira':('humira','adalimumab'),
                  'Methotrexate':('methotrexate','trexall','mtx'),
                  'Mercaptopurine':('mercaptopurine','purinethol','purixan')}
 
-def threads(n=20):
+#The communities (subreddits) the analysis was written for, in the order 
+#they're offered at the prompt, with the treatment dictionary of each. 
+#Functions that take a treatment dictionary need the community's own, so
+#that no report mixes in another community's treatments.
+communities = (('MultipleSclerosis', MSTreatmentDict),
+               ('Diabetes', DiaTreatmentDict),
+               ('Psoriasis', PsTreatmentDict),
+               ('CrohnsDisease', CDtreatmentDict))
+
+class vocabulary(object):
+    """
+    Numbers each distinct word (from 0, in the order they're first seen),
+    so that text can be kept as arrays of integers instead of lists of 
+    strings: 4 bytes per word, counted with NumPy. Each word is stored 
+    once, interned. Tests on words, such as whether a word is a stopword,
+    are kept as boolean masks over the vocabulary (see mask), so they are
+    made once per distinct word instead of once per word of text.
+    """
+    def __init__(self):
+        self.lookup = {} #word -> id
+        self.words = [] #id -> word
+        self.masks = {}
+    
+    def __len__(self):
+        return len(self.words)
+    
+    def encode(self, words):
+        """
+        The ids of a list of words, as an array('i'); new words are added
+        """
+        lookup = self.lookup
+        ids = array('i')
+        for w in words:
+            i = lookup.get(w)
+            if i is None:
+                i = lookup[w] = len(self.words)
+                self.words.append(sys.intern(w))
+            ids.append(i)
+        return ids
+    
+    def decode(self, ids):
+        words = self.words
+        return [words[i] for i in ids]
+    
+    def mask(self, name, test):
+        """
+        NumPy boolean array of test(word) for each word of the vocabulary, 
+        by id. It's kept under `name`, and when the vocabulary has grown 
+        only the new words are tested.
+        """
+        import numpy as np
+        mask = self.masks.get(name)
+        done = 0 if mask is None else len(mask)
+        if done < len(self.words):
+            new = np.fromiter((test(w) for w in self.words[done:]), bool,
+                              len(self.words) - done)
+            mask = new if mask is None else np.concatenate([mask, new])
+            self.masks[name] = mask
+        elif mask is None:
+            mask = np.zeros(0, bool)
+        return mask
+
+#The vocabulary shared by all of the text of the run
+corpusVocabulary = vocabulary()
+
+def isIds(words):
+    """
+    Whether words are given as a NumPy array of corpusVocabulary ids (see 
+    corpusIds) rather than as strings
+    """
+    return hasattr(words, 'dtype')
+
+#Number of ids read at a time from an array of ids, which may be a 
+#tokenCorpus on disk, so that counting them takes memory in proportion to 
+#the vocabulary rather than to the corpus
+idChunkSize = 2**22
+
+def idChunks(ids):
+    """
+    Yields (position, chunk) for consecutive chunks of an array of ids
+    """
+    for start in range(0, len(ids), idChunkSize):
+        yield start, ids[start:start+idChunkSize]
+
+#Every post or comment is described by the same 10 fields: internally
+#assigned thread and post (comment) numbers, the date, the Reddit-assigned
+#id, author name, author flair, the title of the thread, the text, the
+#time of posting as a UTC epoch timestamp and the Reddit id of the post or
+#comment it replies to (None for submissions, and when it isn't known). 
+#The first 8 can also be read by position, as in the lists the threads 
+#function used to produce
+redditPost = namedtuple('redditPost', ['thread', 'comment', 'date', 'id',
+                                       'author', 'flair', 'title', 'text',
+                                       'created', 'parent'])
+#parent can be left out (namedtuple's defaults argument needs Python 3.7)
+redditPost.__new__.__defaults__ = (None,)
+
+class postStore(object):
+    """
+    Compact, column-oriented storage for Reddit posts and comments, returned
+    by the threads function. Instead of one Python list per post, each field
+    is kept in its own column: numbers and timestamps in typed arrays, 
+    author names and flair stored once each and referred to by number, the
+    title stored once per thread, and all of the text in one contiguous
+    (UTF-8 encoded) buffer. Rows are read back with the accessor methods 
+    below, or by iterating over the store, which gives a lightweight view
+    of each row with the same attributes as a redditPost.
+    """
+    def __init__(self):
+        self.threadNums = array('l') #internally assigned thread numbers
+        self.commentNums = array('l') #post number within the thread
+        self.created = array('q') #UTC epoch timestamps
+        self.ids = [] #Reddit-assigned ids
+        self.authorIds = array('l') #row -> position in authorNames
+        self.authorNames = [] #each distinct author name, stored once
+        self.authorLookup = {}
+        self.flairIds = array('l') #row -> position in flairNames
+        self.flairNames = [None] #each distinct flair; 0 means no flair
+        self.flairLookup = {None: 0}
+        self.titles = {} #thread number -> title
+        self.textBuffer = bytearray()
+        self.textEnds = array('q') #row -> end of its text in textBuffer
+        self.tokenLists = [] #row -> ids of the cleaned words of its text
+                             #in corpusVocabulary, once known
+        self.parents = [] #Reddit id of the post each row replies to
+    
+    @classmethod
+    def fromRecords(cls, records):
+        """
+        Builds a store from any iterable of records in the redditPost
+        format (or lists of the first 8 fields), e.g. from dumpThreads()
+        """
+        store = cls()
+        for record in records:
+            store.append(record)
+        return store
+    
+    def add(self, thread, comment, created, postId, author, flair, title,
+            text, parent=None):
+        """
+        Adds one post or comment to the end of the store
+        """
+        self.threadNums.append(thread)
+        self.commentNums.append(comment)
+        self.created.append(int(created))
+        self.ids.append(postId)
+        authorId = self.authorLookup.get(author)
+        if authorId is None:
+            authorId = len(self.authorNames)
+            self.authorNames.append(sys.intern(author))
+            self.authorLookup[author] = authorId
+        self.authorIds.append(authorId)
+        flairId = self.flairLookup.get(flair)
+        if flairId is None:
+            flairId = len(self.flairNames)
+            self.flairNames.append(sys.intern(flair))
+            self.flairLookup[flair] = flairId
+        self.flairIds.append(flairId)
+        if thread not in self.titles:
+            self.titles[thread] = title
+        self.textBuffer += (text or '').encode('utf-8', 'surrogatepass')
+        self.textEnds.append(len(self.textBuffer))
+        self.tokenLists.append(None)
+        self.parents.append(parent)
+    
+    def append(self, record):
+        """
+        Adds a record in the redditPost format; plain lists without a 
+        timestamp get one from their date string (midnight UTC)
+        """
+        if len(record) > 8:
+            created = record[8]
+        else:
+            created = calendar.timegm(time.strptime(record[2], '%b %d, %Y'))
+        self.add(record[0], record[1], created, record[3], record[4],
+                 record[5], record[6], record[7], 
+                 record[9] if len(record) > 9 else None)
+    
+    def __len__(self):
+        return len(self.threadNums)
+    
+    def __getitem__(self, row):
+        if row < 0:
+            row += len(self)
+        if not 0 <= row < len(self):
+            raise IndexError('postStore row out of range')
+        return storedPost(self, row)
+    
+    def __iter__(self):
+        for row in range(len(self)):
+            yield storedPost(self, row)
+    
+    def thread(self, row):
+        return self.threadNums[row]
+    
+    def comment(self, row):
+        return self.commentNums[row]
+    
+    def date(self, row, fmt='%b %d, %Y'):
+        return datetime.utcfromtimestamp(self.created[row]).strftime(fmt)
+    
+    def postId(self, row):
+        return self.ids[row]
+    
+    def parent(self, row):
+        return self.parents[row]
+    
+    def author(self, row):
+        return self.authorNames[self.authorIds[row]]
+    
+    def flair(self, row):
+        return self.flairNames[self.flairIds[row]]
+    
+    def title(self, row):
+        return self.titles[self.threadNums[row]]
+    
+    def text(self, row):
+        start = self.textEnds[row-1] if row else 0
+        return self.textBuffer[start:self.textEnds[row]].decode('utf-8',
+                                                             'surrogatepass')
+    
+    def tokens(self, row):
+        """
+        The text of a row as a list of cleaned words (see wordsClean). Each
+        post is only tokenized the first time its words are needed; after
+        that its words are kept, as ids in corpusVocabulary (see tokenIds),
+        and reused, e.g. by redditText for both the whole corpus and each 
+        author.
+        """
+        return corpusVocabulary.decode(self.tokenIds(row))
+    
+    def tokenIds(self, row):
+        """
+        The corpusVocabulary ids of the cleaned words of a row, as an 
+        array('i'), tokenizing the row's text the first time
+        """
+        ids = self.tokenLists[row]
+        if ids is None:
+            ids = corpusVocabulary.encode(wordsClean(self.text(row)))
+            self.tokenLists[row] = ids
+        return ids
+    
+    def select(self, rows):
+        """
+        New store with only the given rows, in that order (e.g. the posts
+        kept by nearDuplicates), keeping the words of those already 
+        tokenized
+        """
+        store = postStore()
+        for row in rows:
+            store.add(self.threadNums[row], self.commentNums[row], 
+                      self.created[row], self.ids[row], self.author(row), 
+                      self.flair(row), self.title(row), self.text(row),
+                      self.parents[row])
+            store.tokenLists[-1] = self.tokenLists[row]
+        return store
+    
+    def threadCount(self):
+        """
+        Number of distinct threads in the store
+        """
+        return len(self.titles)
+    
+    def authorRows(self, author):
+        """
+        Row numbers of all posts and comments written by the author
+        """
+        authorId = self.authorLookup.get(author)
+        return [row for row, a in enumerate(self.authorIds) if a == authorId]
+
+class storedPost(object):
+    """
+    View of one row of a postStore. Fields are only read from the store's
+    columns when they're used, so scanning e.g. authors doesn't decode text
+    """
+    __slots__ = ('store', 'row')
+    fields = redditPost._fields
+    
+    def __init__(self, store, row):
+        self.store = store
+        self.row = row
+    
+    @property
+    def thread(self):
+        return self.store.thread(self.row)
+    
+    @property
+    def comment(self):
+        return self.store.comment(self.row)
+    
+    @property
+    def date(self):
+        return self.store.date(self.row)
+    
+    @property
+    def id(self):
+        return self.store.postId(self.row)
+    
+    @property
+    def author(self):
+        return self.store.author(self.row)
+    
+    @property
+    def flair(self):
+        return self.store.flair(self.row)
+    
+    @property
+    def title(self):
+        return self.store.title(self.row)
+    
+    @property
+    def text(self):
+        return self.store.text(self.row)
+    
+    @property
+    def created(self):
+        return self.store.created[self.row]
+    
+    @property
+    def parent(self):
+        return self.store.parent(self.row)
+    
+    @property
+    def tokens(self):
+        return self.store.tokens(self.row)
+    
+    def __getitem__(self, pos):
+        return getattr(self, self.fields[pos])
+    
+    def __len__(self):
+        return len(self.fields)
+
+class tokenCorpus(object):
+    """
+    Posts and comments kept on disk after tokenizing, for archives too big
+    to analyze in memory: a directory of flat files of little-endian 
+    numbers, each memory-mapped read-only and used as a NumPy array, so 
+    only the pages being read are loaded and processes analyzing the same
+    corpus share them.
+    
+      tokens.i32    the ids of the cleaned words of every post, one post 
+                    after another
+      offsets.i64   where the words of each post start in tokens (plus the
+                    end of the last one)
+      threads.i32   thread number of each post
+      authors.i32   author number of each post
+      created.i64   UTC epoch timestamp of each post
+      words.txt     the word of each id, one per line
+      authors.jsonl name and flair (of their first post) of each author
+      corpus.json   format and sizes
+    
+    Text isn't kept, only its words, so the corpus can be used wherever 
+    only words are read: corpusIds (and redditText, which decodes them to
+    strings), authorIndex, the dates histogram, the author table and 
+    profileAuthors. When it's opened, its 
+    words are added to corpusVocabulary; in a process that hasn't read 
+    other text first (as when it's opened first, or in a worker process)
+    its ids are the same, and are used from the file as they are.
+    """
+    format = 'rca-corpus-1'
+    #posts buffered by build before they're written out
+    flushRows = 2**16
+    #open corpora by path, so each process maps a corpus once (see open)
+    opened = {}
+    
+    def __init__(self, path):
+        import numpy as np
+        self.path = path
+        with open(os.path.join(path, 'corpus.json')) as f:
+            meta = json.load(f)
+        if meta.get('format') != self.format:
+            raise ValueError("%r is not a token corpus" % path)
+        self.tokenArray = self.mapArray('tokens.i32', '<i4')
+        self.offsets = self.mapArray('offsets.i64', '<i8')
+        self.threadNums = self.mapArray('threads.i32', '<i4')
+        self.authorIds = self.mapArray('authors.i32', '<i4')
+        self.created = self.mapArray('created.i64', '<i8')
+        with open(os.path.join(path, 'words.txt'), encoding='utf-8',
+                  errors='surrogatepass') as f:
+            self.words = f.read().split('\n')[:meta['words']]
+        self.authorNames = []
+        self.authorFlairs = []
+        with open(os.path.join(path, 'authors.jsonl'), 
+                  encoding='utf-8') as f:
+            for line in f:
+                author, flair = json.loads(line)
+                self.authorNames.append(sys.intern(author))
+                self.authorFlairs.append(flair)
+        self.authorLookup = dict((a, i) 
+                                 for i, a in enumerate(self.authorNames))
+        remap = np.frombuffer(corpusVocabulary.encode(self.words), 
+                              dtype=np.int32)
+        if np.array_equal(remap, np.arange(len(remap))):
+            self.remap = None
+        else:
+            self.remap = remap
+    
+    def mapArray(self, name, dtype):
+        import numpy as np
+        with open(os.path.join(self.path, name), 'rb') as f:
+            if not os.fstat(f.fileno()).st_size:
+                return np.zeros(0, dtype=dtype)
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return np.frombuffer(data, dtype=dtype)
+    
+    @classmethod
+    def open(cls, path):
+        """
+        The corpus at path, opened once per process
+        """
+        path = os.path.abspath(path)
+        corpus = cls.opened.get(path)
+        if corpus is None:
+            corpus = cls.opened[path] = cls(path)
+        return corpus
+    
+    def __reduce__(self):
+        #sent to worker processes by path, and mapped again there
+        return (tokenCorpus.open, (self.path,))
+    
+    @classmethod
+    def build(cls, path, posts):
+        """
+        Tokenizes posts (a postStore, or any iterable of redditPost records 
+        such as the stream from dumpThreads(), read once) into a corpus at
+        path, and opens it. Posts are written as they're read, flushRows
+        at a time, so only the vocabulary and the authors are kept in 
+        memory.
+        """
+        import numpy as np
+        os.makedirs(path, exist_ok=True)
+        names = ('tokens.i32', 'offsets.i64', 'threads.i32', 'authors.i32',
+                 'created.i64')
+        dtypes = ('<i4', '<i8', '<i4', '<i4', '<i8')
+        files = [open(os.path.join(path, name), 'wb') for name in names]
+        #rows waiting to be written, one buffer per file
+        buffers = [array('i'), array('q', [0]), array('i'), array('i'), 
+                   array('q')]
+        tokens, offsets, threadNums, authorIds, created = buffers
+        
+        def flush():
+            for f, buffer, dtype in zip(files, buffers, dtypes):
+                np.frombuffer(buffer, buffer.typecode).astype(
+                    dtype, copy=False).tofile(f)
+                del buffer[:]
+        
+        lookup = {}
+        authors = []
+        rows = end = 0
+        try:
+            for row, item in enumerate(posts):
+                if isinstance(posts, postStore):
+                    ids = posts.tokenIds(row)
+                else:
+                    ids = corpusVocabulary.encode(wordsClean(item.text))
+                authorId = lookup.get(item.author)
+                if authorId is None:
+                    authorId = lookup[item.author] = len(authors)
+                    authors.append((item.author, item.flair))
+                end += len(ids)
+                tokens.extend(ids)
+                offsets.append(end)
+                threadNums.append(item.thread)
+                authorIds.append(authorId)
+                created.append(int(item.created))
+                rows += 1
+                if not rows % cls.flushRows:
+                    flush()
+            flush()
+        finally:
+            for f in files:
+                f.close()
+        with open(os.path.join(path, 'words.txt'), 'w', encoding='utf-8',
+                  errors='surrogatepass') as f:
+            f.write('\n'.join(corpusVocabulary.words))
+        with open(os.path.join(path, 'authors.jsonl'), 'w', 
+                  encoding='utf-8') as f:
+            for author in authors:
+                f.write(json.dumps(author) + '\n')
+        #written last: a corpus without it wasn't finished
+        with open(os.path.join(path, 'corpus.json'), 'w') as f:
+            json.dump({'format': cls.format, 'rows': rows, 'tokens': end,
+                       'words': len(corpusVocabulary), 
+                       'authors': len(authors)}, f)
+        cls.opened.pop(os.path.abspath(path), None)
+        return cls.open(path)
+    
+    def __len__(self):
+        return len(self.authorIds)
+    
+    def ids(self):
+        """
+        The corpusVocabulary ids of all of the words of the corpus: the 
+        mapped file itself, unless the ids had to be translated
+        """
+        if self.remap is None:
+            return self.tokenArray
+        return self.remap[self.tokenArray]
+    
+    def tokenIds(self, row):
+        """
+        The corpusVocabulary ids of the words of a post
+        """
+        ids = self.tokenArray[self.offsets[row]:self.offsets[row+1]]
+        return ids if self.remap is None else self.remap[ids]
+    
+    def tokens(self, row):
+        """
+        The words of a post (see postStore.tokens)
+        """
+        return corpusVocabulary.decode(self.tokenIds(row).tolist())
+    
+    def threadCount(self):
+        import numpy as np
+        return len(np.unique(self.threadNums))
+    
+    def authorRows(self, author):
+        """
+        Row numbers of all posts and comments written by the author
+        """
+        import numpy as np
+        authorId = self.authorLookup.get(author, -1)
+        return np.flatnonzero(self.authorIds == authorId)
+    
+    def authorCounts(self):
+        """
+        Number of posts per author, in the format of authorCount()
+        """
+        import numpy as np
+        counts = np.bincount(self.authorIds, minlength=len(self.authorNames))
+        return defaultdict(int, zip(self.authorNames, counts.tolist()))
+
+class runProfiler(object):
+    """
+    Instrumentation of a run: for each stage (fetching, tokenizing, 
+    redditRx, ...), its wall time, CPU time and the peak memory of the 
+    process by its end (or, with memory=True, the peak memory allocated 
+    during the stage, traced with tracemalloc, which slows the run down);
+    and counters of API calls, rows, tokens, generated misspelling 
+    variants, cache hits and so on. One stage can be run under cProfile 
+    or tracemalloc (hook), with the results written to hookPath.
+    The profiler of the run is set as runProfile; the functions of the
+    analysis report to it through profileStage and countEvent, which do 
+    nothing when there is none.
+    """
+    def __init__(self, memory=False, hookStage=None, hook='cprofile', 
+                 hookPath=None):
+        self.stages = []
+        self.counters = Counter()
+        self.lock = threading.Lock()
+        self.memory = memory
+        self.hookStage = hookStage
+        self.hook = hook
+        self.hookPath = hookPath
+        if memory:
+            import tracemalloc
+            tracemalloc.start()
+    
+    @contextlib.contextmanager
+    def stage(self, name):
+        """
+        Context manager measuring the code run in it as the stage `name`
+        """
+        import tracemalloc
+        hooked = name == self.hookStage
+        if hooked and self.hook == 'cprofile':
+            import cProfile
+            profile = cProfile.Profile()
+            profile.enable()
+        elif hooked and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        if tracemalloc.is_tracing():
+            #before Python 3.9, the peak can't be reset, and is the peak
+            #since tracing started
+            if hasattr(tracemalloc, 'reset_peak'):
+                tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield self
+        finally:
+            timing = {'stage': name,
+                      'seconds': round(time.perf_counter() - start, 4),
+                      'cpu_seconds': round(time.process_time() - cpu, 4)}
+            if tracemalloc.is_tracing():
+                timing['peak_mb'] = round((tracemalloc.get_traced_memory()[1]
+                                           - before)/2**20, 2)
+            timing['max_rss_mb'] = maxRss()
+            if hooked and self.hook == 'cprofile':
+                profile.disable()
+                profile.dump_stats(self.hookPath)
+            elif hooked:
+                snapshot = tracemalloc.take_snapshot()
+                with open(self.hookPath, 'w', encoding='utf-8') as out:
+                    for stat in snapshot.statistics('lineno')[:50]:
+                        print(stat, file=out)
+                if not self.memory:
+                    tracemalloc.stop()
+            self.stages.append(timing)
+    
+    def count(self, name, n=1):
+        with self.lock:
+            self.counters[name] += n
+    
+    def report(self):
+        """
+        Everything measured, as a dictionary
+        """
+        return {'stages': self.stages, 'counters': dict(self.counters),
+                'max_rss_mb': maxRss()}
+    
+    def write(self, path):
+        with open(path, 'w', encoding='utf-8') as out:
+            json.dump(self.report(), out, indent=2)
+
+def maxRss():
+    """
+    Peak memory (resident set size) of the process so far, in MB, where
+    the resource module can tell it
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    #in kilobytes on Linux, in bytes on macOS
+    return round(peak/(2**20 if sys.platform == 'darwin' else 2**10), 1)
+
+#The runProfiler of the run, if it's being profiled (--profile)
+runProfile = None
+
+def profileStage(name):
+    """
+    Measures the code run in this context manager as a stage of the run
+    (if it's being profiled)
+    """
+    if runProfile is None:
+        return unprofiledStage()
+    return runProfile.stage(name)
+
+@contextlib.contextmanager
+def unprofiledStage():
+    #contextlib.nullcontext, which needs Python 3.7
+    yield
+
+def profilerOf(path, memory=False, stage=None, hook='cprofile'):
+    """
+    Creates the runProfiler of a run whose profile is written to path; the
+    cProfile stats (.prof) or tracemalloc statistics (.txt) of a hooked 
+    stage are written next to it
+    """
+    hookPath = None
+    if stage:
+        hookPath = '%s.%s.%s' % (os.path.splitext(path)[0], stage,
+                                 'prof' if hook == 'cprofile' else 'txt')
+    return runProfiler(memory, stage, hook, hookPath)
+
+def countCache(cache):
+    """
+    Adds the counters of a threadCache to those of the run
+    """
+    for name, value in cache.stats().items():
+        if name in ('hits', 'misses', 'stale', 'evictions', 
+                    'requests_saved'):
+            countEvent('cache_' + name, value)
+
+def countEvent(name, n=1):
+    """
+    Adds n to the counter `name` of the run (if it's being profiled)
+    """
+    if runProfile is not None:
+        runProfile.count(name, n)
+
+class tokenBucket(object):
+    """
+    Thread-safe token bucket rate limiter: allows on average `rate` 
+    requests per second, with bursts of up to `capacity` requests. One 
+    bucket is shared by all of the workers fetching threads in parallel, 
+    so together they stay within Reddit's API rate limit.
+    """
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or max(1, rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+    
+    def acquire(self, tokens=1):
+        """
+        Takes tokens from the bucket, waiting until enough have accumulated
+        """
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity,
+                                  self.tokens + (now-self.updated)*self.rate)
+                self.updated = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = (tokens - self.tokens)/self.rate
+            time.sleep(wait)
+
+#Number of Reddit API requests made so far by each thread (of execution),
+#counted by limitedRequestor, e.g. to know what fetching a thread cost
+apiCalls = threading.local()
+
+class limitedRequestor(object):
+    """
+    PRAW requestor that takes a token from a tokenBucket (if any) before 
+    every HTTP request, including the ones PRAW makes inside replace_more,
+    and counts the requests in apiCalls. It wraps a prawcore Requestor
+    instead of subclassing it, so that prawcore is only imported once a 
+    client is created.
+    """
+    def __init__(self, *args, bucket=None, **kwargs):
+        import prawcore
+        self.requestor = prawcore.Requestor(*args, **kwargs)
+        self.bucket = bucket
+    
+    def __getattr__(self, name):
+        return getattr(self.requestor, name)
+    
+    def request(self, *args, **kwargs):
+        if self.bucket is not None:
+            self.bucket.acquire()
+        apiCalls.count = getattr(apiCalls, 'count', 0) + 1
+        countEvent('api_calls')
+        return self.requestor.request(*args, **kwargs)
+
+def redditClient(bucket=None, **settings):
+    """
+    Creates a praw.Reddit client from keyword settings (client_id, 
+    client_secret, user_agent, ...). If a tokenBucket is given, every 
+    request the client makes is rate limited by it.
+    """
+    import praw
+    settings = dict(settings, requestor_class=limitedRequestor,
+                    requestor_kwargs={'bucket': bucket})
+    return praw.Reddit(**settings)
+
+class threadCache(object):
+    """
+    Local on-disk cache of fetched threads, in an SQLite database keyed by
+    Reddit submission id. Each entry holds a thread's rows (as returned by
+    fetchThread, with the comment tree fully expanded) compressed, when it
+    was fetched and how many API requests that took. Entries older than
+    `ttl` seconds are stale and are fetched again; when the cache grows
+    past `maxBytes`, the least recently used entries are removed.
+    The hits, misses, stale and evictions counters, and requestsSaved 
+    (the API requests the hits would have taken), show what it saves.
+    """
+    def __init__(self, path, ttl=3600, maxBytes=256*2**20):
+        self.ttl = ttl
+        self.maxBytes = maxBytes
+        #threads() may use the cache from several fetch workers at once
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("""CREATE TABLE IF NOT EXISTS threads (
+                           id TEXT PRIMARY KEY, fetched REAL, used REAL, 
+                           requests INTEGER, size INTEGER, rows BLOB)""")
+        self.db.execute("""CREATE INDEX IF NOT EXISTS threads_used 
+                           ON threads (used)""")
+        self.db.commit()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.evictions = 0
+        self.requestsSaved = 0
+    
+    def get(self, sub_id):
+        """
+        Returns the cached rows of a thread (an empty list for a skipped 
+        submission), or None if it isn't cached or its entry is stale
+        """
+        with self.lock:
+            entry = self.db.execute("""SELECT fetched, requests, rows 
+                                       FROM threads WHERE id = ?""",
+                                    (sub_id,)).fetchone()
+            if entry is None:
+                self.misses +=1
+                return None
+            fetched, requests, rows = entry
+            now = time.time()
+            if now - fetched > self.ttl:
+                self.misses +=1
+                self.stale +=1
+                return None
+            self.db.execute('UPDATE threads SET used = ? WHERE id = ?',
+                            (now, sub_id))
+            self.db.commit()
+            self.hits +=1
+            self.requestsSaved += requests
+            return json.loads(zlib.decompress(rows).decode('utf-8'))
+    
+    def put(self, sub_id, rows, requests=0):
+        """
+        Stores (or refreshes) the rows of a thread, then evicts least 
+        recently used entries until the cache fits in maxBytes
+        """
+        blob = zlib.compress(json.dumps(rows or []).encode('utf-8'))
+        now = time.time()
+        with self.lock:
+            self.db.execute("""INSERT OR REPLACE INTO threads 
+                               VALUES (?, ?, ?, ?, ?, ?)""",
+                            (sub_id, now, now, requests, len(blob), blob))
+            total = self.db.execute('SELECT SUM(size) FROM threads'
+                                    ).fetchone()[0] or 0
+            if total > self.maxBytes:
+                for old_id, size in self.db.execute("""SELECT id, size 
+                        FROM threads ORDER BY used""").fetchall():
+                    if total <= self.maxBytes:
+                        break
+                    self.db.execute('DELETE FROM threads WHERE id = ?',
+                                    (old_id,))
+                    total -= size
+                    self.evictions +=1
+            self.db.commit()
+    
+    def stats(self):
+        """
+        Counters and current size of the cache, as a dictionary
+        """
+        with self.lock:
+            entries, size = self.db.execute("""SELECT COUNT(*), SUM(size) 
+                                               FROM threads""").fetchone()
+        return {'hits': self.hits, 'misses': self.misses, 
+                'stale': self.stale, 'evictions': self.evictions,
+                'requests_saved': self.requestsSaved, 'entries': entries,
+                'bytes': size or 0}
+    
+    def close(self):
+        self.db.close()
+
+def fetchThread(submission):
+    """
+    Expands the full comment tree of one submission (the slow part of
+    fetching: replace_more makes one API request per "load more comments"
+    link) and returns the submission and its comments as a list of
+    (created, id, author, flair, title, text, parent id) tuples, submission
+    first.
+    Returns None if the submission's author has deleted their account.
+    """
+    start = time.perf_counter()
+    submission.comments.replace_more(limit=None)
+    #threads are expanded in parallel, so this is the total time spent 
+    #expanding them, not a stage of the run
+    countEvent('replace_more_seconds', time.perf_counter() - start)
+    countEvent('threads_expanded')
+    title = submission.title
+    try: #if author deletes comment there is no author name for 
+         #comment deleted this try-except block avoids an 
+         #AttributeError by skipping over the comment
+        author = submission.author.name
+    except:
+        print('Attribute error')
+        return None
+    rows = [(submission.created_utc, submission.id, author,
+             submission.author_flair_text, title, submission.selftext, None)]
+    #this captures all the comments for the current thread
+    #then loops through each comment to extract relevant info; parent_id
+    #is the "fullname" of the comment or submission replied to, e.g. 
+    #t1_e2ab3cd for comment e2ab3cd
+    for comment in submission.comments.list():
+        rows.append((comment.created_utc, comment.id, str(comment.author),
+                     comment.author_flair_text, title, comment.body,
+                     comment.parent_id.split('_')[-1]))
+    return rows
+
+def withRetries(call, retries=3, backoff=1.0, what='request'):
+    """
+    Calls call() and returns its result. If it raises an error, waits and
+    tries again up to `retries` more times, doubling the wait each time 
+    (backoff, 2*backoff, 4*backoff... seconds), so that a temporary Reddit
+    or network problem doesn't end the whole import. Raises the last error 
+    if every attempt fails.
+    """
+    for attempt in range(retries+1):
+        try:
+            return call()
+        except Exception as e:
+            if attempt == retries:
+                raise
+            wait = backoff * 2**attempt
+            print("Error fetching %s: %s" % (what, e))
+            print("Retrying in %g seconds" % wait)
+            time.sleep(wait)
+
+def readJournal(path):
+    """
+    Reads the journal of completed threads written by threads(journal=...):
+    one JSON object per line with the submission id, its creation time and
+    its rows (null for skipped submissions). Returns a dictionary from
+    submission id to entry. A missing journal is empty, and a last line
+    cut short by a crash is ignored.
+    """
+    completed = {}
+    try:
+        with open(path, encoding='utf-8') as journal:
+            for line in journal:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                completed[entry['id']] = entry
+    except FileNotFoundError:
+        pass
+    return completed
+
+def threads(n=20, workers=1, rate=None, journal=None, newer=False,
+            retries=3, backoff=1.0, cache=None, subreddit='MultipleSclerosis'):
     """
     Takes as input a number of new Reddit submissions (threads) to import
     with 20 as default. Captures both submission/post and its comments.
-    Produces as output a list of lists. Each list contains internally 
+    Produces as output a postStore (see above). Each row contains internally 
     assigned thread and post ids, Reddit-assigned ids, author names, 
     author flair, dates, the content of the submissions, and these same 
-    categories for comments
+    categories for comments.
+    With workers > 1, the comment trees of that many threads are expanded
+    in parallel, each worker with its own Reddit client (PRAW clients are
+    not thread-safe) and all sharing one tokenBucket allowing `rate` 
+    requests per second (by default Reddit's limit of 100 per minute).
+    Threads are numbered and stored in listing order either way, so the
+    output does not depend on which worker finishes first.
+    A failed request is retried with exponential backoff (see withRetries)
+    and only the thread it belongs to is fetched again; a thread that still
+    fails is skipped. With a journal file, each completed thread is written
+    to it as soon as it's fetched, and threads already in the journal are 
+    read from it instead of Reddit, so a rerun after a crash resumes where
+    the last run stopped. With newer=True, only threads posted after the
+    newest one in the journal are fetched and returned.
+    With a threadCache, threads that were fetched recently enough are read
+    from the cache, and only new or stale ones are fetched from Reddit.
+    The subreddit is given by name (or as a PRAW Subreddit). Requests are
+    made with the Reddit client created by the script, or, if there is
+    none or a rate is given, with a new one made from redditSettings.
     """
-    threadz = []
+    bucket = None
+    if workers > 1 or rate is not None:
+        bucket = tokenBucket(rate or redditRate, redditBurst)
+    if reddit is not None and rate is None:
+        client = reddit
+    else:
+        client = redditClient(bucket, **redditSettings)
+    if isinstance(subreddit, str):
+        subreddit = client.subreddit(subreddit)
+    threadz = postStore()
     thread_count = 0
+    completed = readJournal(journal) if journal else {}
+    params = {}
+    if newer and completed:
+        #Reddit's "before" parameter gives the listing items newer than
+        #the given submission (its fullname is t3_ followed by the id)
+        lastSeen = max(completed.values(), key=lambda e: e['created'])
+        params['before'] = 't3_' + lastSeen['id']
     try:
-        for submission in subreddit.new(limit=n):
-            submission.comments.replace_more(limit=None)
-            date = datetime.utcfromtimestamp(submission.created_utc)
-            thread_count +=1
-            comment_count = 1
-            title = submission.title
-            sub_id = submission.id
-            try: #if author deletes comment there is no author name for 
-                 #comment deleted this try-except block avoids an 
-                 #AttributeError by skipping over the comment
-                author = submission.author.name
-            except:
-                print('Attribute error')
-                continue
-            author_flair = submission.author_flair_text
-            text = submission.selftext
-            #All of the information captured into variables is stored
-            #in a list; in later functions, information is selectively 
-            #extracted from this list as needed
-            x = [thread_count, comment_count, date.strftime('%b %d, %Y'), 
-                 sub_id, author, author_flair, title, text]
-            threadz.append(x)
-            all_comments = submission.comments.list()
-            #this captures all the comments for the current thread
-            #then loops through each comment to extract & store relevant info
-            for comment in all_comments:
-                date = datetime.utcfromtimestamp(comment.created_utc)
-                author = str(comment.author)
-                author_flair = comment.author_flair_text
-                text = comment.body
-                comment_count +=1
-                comment_id = comment.id
-                y = [thread_count, comment_count, date.strftime('%b %d, %Y'), 
-                     comment_id, author, author_flair, title, text]
-                threadz.append(y)
+        listing = withRetries(lambda: list(subreddit.new(limit=n,
+                                                          params=params)),
+                              retries, backoff, 'new submissions')
     except Exception as e: 
         print("General error:",e)
-        print("Reducing threads:", n)
-        threads(n-1) #if the above author exception fails, loop recursively 
-                     #backwards through threads until no errors are raised
+        return threadz
+    journalLock = threading.Lock()
+    out = open(journal, 'a', encoding='utf-8') if journal else None
+    
+    def fetch(submission, client):
+        entry = completed.get(submission.id)
+        if entry is not None:
+            countEvent('journal_hits')
+            return entry['rows']
+        if cache is not None:
+            rows = cache.get(submission.id)
+            if rows is not None:
+                return rows
+        requests = getattr(apiCalls, 'count', 0)
+        try:
+            #a fresh submission object for each attempt, since a comment 
+            #tree that was partly expanded can't be expanded again
+            rows = withRetries(lambda: fetchThread(
+                client.submission(id=submission.id)), retries, backoff,
+                'thread %s' % submission.id)
+        except Exception as e: 
+            print("General error:",e)
+            print("Skipping thread:", submission.id)
+            return None
+        if cache is not None:
+            cache.put(submission.id, rows,
+                      getattr(apiCalls, 'count', 0) - requests)
+        if out is not None:
+            with journalLock:
+                out.write(json.dumps({'id': submission.id,
+                                      'created': submission.created_utc,
+                                      'rows': rows}) + '\n')
+                out.flush()
+        return rows
+    
+    try:
+        if workers > 1:
+            clients = threading.local()
+            def fetchWorker(submission):
+                if not hasattr(clients, 'reddit'):
+                    clients.reddit = redditClient(bucket, **redditSettings)
+                return fetch(submission, clients.reddit)
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                fetched = list(pool.map(fetchWorker, listing))
+        else:
+            fetched = [fetch(submission, client) for submission in listing]
+    finally:
+        if out is not None:
+            out.close()
+    for rows in fetched:
+        thread_count +=1
+        if not rows:
+            continue
+        #All of the information captured is stored in the columns of 
+        #the store; in later functions, information is selectively 
+        #extracted from it as needed
+        #(rows cached or journaled by earlier versions have no parent id)
+        for comment_count, row in enumerate(rows, 1):
+            created, post_id, author, author_flair, title, text = row[:6]
+            threadz.add(thread_count, comment_count, created, post_id,
+                        author, author_flair, title, text, 
+                        row[6] if len(row) > 6 else None)
     return threadz
 
-def redditText(threadz, author=None):
+def openDump(path):
+    """
+    Opens a local Reddit dump file for reading as text, decompressing it on
+    the fly based on its extension (.gz, .bz2, .xz or .zst; anything else
+    is read as plain JSONL). Zstandard files need the optional zstandard
+    package, which is the format used by the Pushshift archives.
+    """
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8')
+    elif path.endswith('.bz2'):
+        return bz2.open(path, 'rt', encoding='utf-8')
+    elif path.endswith('.xz'):
+        return lzma.open(path, 'rt', encoding='utf-8')
+    elif path.endswith('.zst'):
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError("Reading .zst dumps requires the zstandard "
+                              "package (pip install zstandard)")
+        #Pushshift archives are compressed with a long window, so the
+        #default maximum window size of the decompressor is not enough
+        dctx = zstandard.ZstdDecompressor(max_window_size=2**31)
+        return io.TextIOWrapper(dctx.stream_reader(open(path, 'rb')),
+                                encoding='utf-8')
+    return open(path, encoding='utf-8')
+
+def dumpThreads(paths, n=None, subreddit=None):
+    """
+    Offline alternative to the threads function: streams submissions and
+    comments from local dump files (one JSON object per line, as in the
+    Pushshift archives or saved Reddit API listings) instead of fetching
+    them with PRAW. This is a generator, so records are produced one at a
+    time as redditPost records (see above) and memory stays bounded even
+    for very large archives. Takes a path or a list of paths (e.g. a
+    submissions dump followed by a comments dump), an optional maximum
+    number of threads n, and an optional subreddit name to keep when a
+    dump mixes several communities.
+    """
+    if isinstance(paths, str):
+        paths = [paths]
+    if subreddit:
+        subreddit = subreddit.lower()
+    #Only a few numbers per thread are kept, not the posts themselves:
+    #Reddit id of the submission -> [thread_count, comment_count, title]
+    seen = {}
+    thread_count = 0
+    for path in paths:
+        with openDump(path) as dump:
+            for line in dump:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    item = json.loads(line)
+                except ValueError:
+                    print('Skipping unreadable line in', path)
+                    continue
+                #Saved API listings wrap each object as {"kind":..,"data":..}
+                if 'data' in item and 'kind' in item:
+                    item = item['data']
+                if subreddit and item.get('subreddit') and \
+                   item['subreddit'].lower() != subreddit:
+                    continue
+                created = int(float(item.get('created_utc', 0)))
+                date = datetime.utcfromtimestamp(created)
+                author = item.get('author')
+                author_flair = item.get('author_flair_text')
+                if 'title' in item: #submissions have titles, comments don't
+                    if n is not None and thread_count >= n:
+                        continue
+                    #As in threads(), submissions whose author deleted
+                    #their account are skipped along with their comments
+                    if author is None or author == '[deleted]':
+                        continue
+                    thread_count +=1
+                    sub_id = item['id']
+                    title = item['title']
+                    seen[sub_id] = [thread_count, 1, title]
+                    yield redditPost(thread_count, 1,
+                                     date.strftime('%b %d, %Y'), sub_id,
+                                     author, author_flair, title,
+                                     item.get('selftext') or '', created)
+                else:
+                    #link_id of a comment is the "fullname" of its
+                    #submission, e.g. t3_8xwlg9 for submission 8xwlg9
+                    link_id = item.get('link_id') or ''
+                    thread = seen.get(link_id.split('_')[-1])
+                    if thread is None:
+                        continue
+                    thread[1] +=1
+                    parent_id = item.get('parent_id') or None
+                    yield redditPost(thread[0], thread[1],
+                                     date.strftime('%b %d, %Y'),
+                                     item.get('id'), str(author),
+                                     author_flair, thread[2],
+                                     item.get('body') or '', created,
+                                     parent_id and parent_id.split('_')[-1])
+
+def redditText(threadz, author=None, index=None):
     """
     Converts text from posts pulled from Reddit into a list of words.
     If an author is specified, returns word list for only that author.
+    Posts can be the postStore returned by threads() or any other iterable
+    of redditPost records, such as the stream from dumpThreads(). 
+    With an authorIndex, the author's posts are looked up by row number.
+    Each post is tokenized separately; in a postStore its words are kept
+    (see postStore.tokens), so the list is built by joining the words of
+    each post without tokenizing any text a second time.
     """
-    #Post contents are stored in the 8th "slot" for each post or comment
-    #pulled in by the threads function
+    cleanTxt = []
+    if isinstance(threadz, (postStore, tokenCorpus)):
+        if author == None:
+            rows = range(len(threadz))
+        elif index is not None:
+            rows = index[author].rows
+        else:
+            #the store can find the author's rows without decoding any text
+            rows = threadz.authorRows(author)
+        for row in rows:
+            cleanTxt.extend(threadz.tokens(row))
+        return cleanTxt
     if author == None:
-        text = [''.join(w[7]) for w in threadz]
+        posts = threadz
+    elif index is not None:
+        posts = (threadz[row] for row in index[author].rows)
     else:
-        #Usernames of authors are stored in the 5th slot by the threads func
-        text = [''.join(w[7]) for w in threadz if w[4] == author]
-    text = str(text)
-    cleanTxt = wordsClean(text)
+        posts = (w for w in threadz if w.author == author)
+    for w in posts:
+        cleanTxt.extend(wordsClean(w.text))
     return cleanTxt
+
+def corpusIds(threadz, author=None, index=None):
+    """
+    Same as redditText, but the words are returned as a NumPy array of 
+    their ids in corpusVocabulary, which uncommonWords, keywords and 
+    treatmentCount count with NumPy. A postStore's rows are read from the
+    ids it keeps, without making a list of strings; the ids of a whole 
+    tokenCorpus are read from its file.
+    """
+    import numpy as np
+    if isinstance(threadz, tokenCorpus):
+        if author == None:
+            return threadz.ids()
+        rows = index[author].rows if index is not None \
+               else threadz.authorRows(author)
+        return np.concatenate([threadz.tokenIds(row) for row in rows] or 
+                              [np.zeros(0, dtype=np.int32)])
+    ids = array('i')
+    if isinstance(threadz, postStore):
+        if author == None:
+            rows = range(len(threadz))
+        elif index is not None:
+            rows = index[author].rows
+        else:
+            rows = threadz.authorRows(author)
+        for row in rows:
+            ids.extend(threadz.tokenIds(row))
+    else:
+        if author == None:
+            posts = threadz
+        elif index is not None:
+            posts = (threadz[row] for row in index[author].rows)
+        else:
+            posts = (w for w in threadz if w.author == author)
+        for w in posts:
+            ids.extend(corpusVocabulary.encode(wordsClean(w.text)))
+    return np.frombuffer(ids, dtype=np.int32) if ids else \
+           np.zeros(0, dtype=np.int32)
+
+def corpusOffsets(threadz):
+    """
+    Where the words of each post of a postStore or tokenCorpus start in 
+    corpusIds(threadz), plus the end of the last one, as a NumPy array
+    """
+    import numpy as np
+    if isinstance(threadz, tokenCorpus):
+        return threadz.offsets
+    offsets = np.zeros(len(threadz)+1, dtype=np.int64)
+    np.cumsum([len(threadz.tokenIds(row)) for row in range(len(threadz))], 
+              out=offsets[1:])
+    return offsets
+
+def tokenWeights(threadz, weights):
+    """
+    Weights of each post (e.g. from nearDuplicates.weights) repeated for 
+    each of its words, to weigh the words of corpusIds(threadz)
+    """
+    import numpy as np
+    return np.repeat(weights, np.diff(corpusOffsets(threadz)))
+
+def weightedCount(count):
+    """
+    A count summed from weights, as shown in the report: to 2 decimals, 
+    and without them when it's a whole number
+    """
+    count = round(float(count), 2)
+    return int(count) if count == int(count) else count
+
+class nearDuplicates(object):
+    """
+    Finds groups of posts with nearly the same text (cross-posts, copied 
+    messages, bot comments) in a postStore or tokenCorpus, without 
+    comparing every pair of posts. Each post's text is reduced to a MinHash
+    signature of its `shingle`-word sequences: for each of `numPerm` hash 
+    functions, the lowest hash of any of them, computed with NumPy a chunk 
+    of words at a time. Two posts agree on a signature entry with 
+    probability equal to the Jaccard similarity of their sequences.
+    Signatures are cut into bands, and posts whose band is identical land 
+    in the same bucket (locality-sensitive hashing); only posts sharing a
+    bucket are compared, and those whose signatures agree on at least 
+    `threshold` of their entries are grouped. The bands are picked so that
+    pairs at the threshold very probably share a bucket. Posts with fewer
+    than minWords words aren't compared ("thanks!" is not a duplicate).
+    The earliest post of each group (by created timestamp, then by row) 
+    is taken as the original: `original` gives each post's original row 
+    (its own row for posts with no duplicates).
+    """
+    def __init__(self, threadz, threshold=0.8, numPerm=128, shingle=3, 
+                 minWords=10, seed=1):
+        import numpy as np
+        from scipy import sparse
+        from scipy.sparse.csgraph import connected_components
+        self.threshold = threshold
+        ids = corpusIds(threadz)
+        offsets = np.asarray(corpusOffsets(threadz), dtype=np.int64)
+        n = len(offsets) - 1
+        eligible = np.diff(offsets) >= max(minWords, shingle)
+        rng = np.random.RandomState(seed)
+        mult = rng.randint(0, 2**62, numPerm).astype(np.uint64)*2 + 1
+        add = rng.randint(0, 2**62, numPerm).astype(np.uint64)
+        mix = (rng.randint(0, 2**62, shingle).astype(np.uint64)*2 + 1)
+        
+        top = np.iinfo(np.uint32).max
+        signatures = np.full((n, numPerm), top, dtype=np.uint32)
+        #in chunks of positions where a shingle may start
+        step = max(1, 2**20 // numPerm)
+        for start in range(0, max(0, len(ids) - shingle + 1), step):
+            end = min(start + step, len(ids) - shingle + 1)
+            words = np.asarray(ids[start:end+shingle-1], dtype=np.uint64)
+            pos = np.arange(start, end)
+            owner = np.searchsorted(offsets, pos, 'right') - 1
+            valid = (pos + shingle <= offsets[owner+1]) & eligible[owner]
+            if not valid.any():
+                continue
+            x = np.zeros(end - start, dtype=np.uint64)
+            for k in range(shingle):
+                x ^= words[k:k+end-start]*mix[k]
+            x, owner = x[valid], owner[valid]
+            #one row per hash function, reduced along its (contiguous) row
+            hashes = ((mult[:, None]*x + add[:, None]) >> np.uint64(32))\
+                     .astype(np.uint32)
+            #owners are in order, so each one's shingles are consecutive
+            first = np.flatnonzero(np.r_[True, owner[1:] != owner[:-1]])
+            signatures[owner[first]] = np.minimum(
+                signatures[owner[first]], 
+                np.minimum.reduceat(hashes, first, axis=1).T)
+        self.signatures = signatures
+        
+        #the most rows per band whose threshold (1/bands)**(1/rows) is 
+        #still below the threshold asked for
+        rows = 1
+        for r in range(1, numPerm+1):
+            if numPerm % r == 0 and (r/numPerm)**(1/r) <= threshold:
+                rows = r
+        self.bands = numPerm // rows
+        candidates = np.flatnonzero(eligible)
+        pairs = []
+        for band in range(self.bands if len(candidates) > 1 else 0):
+            part = signatures[candidates, band*rows:(band+1)*rows]
+            key = np.zeros(len(candidates), dtype=np.uint64)
+            for k in range(rows):
+                key = key*np.uint64(1000003) ^ part[:, k].astype(np.uint64)
+            order = np.argsort(key, kind='stable')
+            key = key[order]
+            start = np.r_[True, key[1:] != key[:-1]]
+            group = np.cumsum(start) - 1
+            leader = candidates[order[np.flatnonzero(start)][group]]
+            member = candidates[order]
+            same = leader != member
+            leader, member = leader[same], member[same]
+            agree = (signatures[leader] == signatures[member]).mean(axis=1)
+            close = agree >= threshold
+            pairs.append((leader[close], member[close]))
+        leaders = np.concatenate([p[0] for p in pairs] or [np.zeros(0, int)])
+        members = np.concatenate([p[1] for p in pairs] or [np.zeros(0, int)])
+        graph = sparse.coo_matrix((np.ones(len(leaders)), 
+                                   (leaders, members)), shape=(n, n))
+        groups, labels = connected_components(graph, directed=False)
+        #rows by group, then by time; every group has at least one row
+        created = np.asarray(threadz.created, dtype=np.int64)
+        order = np.lexsort((np.arange(n), created, labels))
+        starts = np.ones(n, dtype=bool)
+        starts[1:] = labels[order][1:] != labels[order][:-1]
+        first = order[starts]
+        self.labels = labels
+        self.original = first[labels]
+        self.sizes = np.bincount(labels)[labels]
+    
+    def __len__(self):
+        return len(self.original)
+    
+    def duplicates(self):
+        """
+        Rows of the posts that are near-duplicates of their group's 
+        original
+        """
+        import numpy as np
+        return np.flatnonzero(self.original != np.arange(len(self)))
+    
+    def keep(self, counted=None):
+        """
+        Rows of the originals, and of the posts without near-duplicates.
+        counted can mark (with a boolean per row) posts that were already
+        counted elsewhere, e.g. by an analysisSnapshot in an earlier run:
+        a group with a counted post was counted then, so only its counted
+        posts are kept, and none of its new ones.
+        """
+        import numpy as np
+        keep = self.original == np.arange(len(self))
+        if counted is not None:
+            counted = np.asarray(counted, dtype=bool)
+            seen = np.bincount(self.labels, counted) > 0
+            keep = np.where(seen[self.labels], counted, keep)
+        return np.flatnonzero(keep)
+    
+    def weights(self):
+        """
+        Weight of each post for counting: 1 divided by the size of its 
+        group, so each group of near-duplicates counts as one post
+        """
+        return 1.0 / self.sizes
     
-def wordsClean(text):
+    def groups(self):
+        """
+        Each group of near-duplicate posts, as a list of rows, largest
+        groups first
+        """
+        import numpy as np
+        order = np.argsort(self.labels, kind='stable')
+        labels = self.labels[order]
+        cuts = np.flatnonzero(labels[1:] != labels[:-1]) + 1
+        groups = [g.tolist() for g in np.split(order, cuts) if len(g) > 1]
+        return sorted(groups, key=len, reverse=True)
+    
+#Which tokenizer wordsClean uses: 'nltk' (nltk.word_tokenize followed by
+#the clean-up steps below) or 'fast' (fastWordsClean, one compiled regex)
+tokenizerEngine = 'nltk'
+
+#Patterns for fastWordsClean. Characters that NLTK always splits words on,
+#or that wordsClean splits or strips them on, can't be part of a word:
+wordBreaks = r'\s;#$%&?!()\[\]<>"/\-|*\'`‒-―«„»’@{}“”‘'
+#a word can't start or end with a character stripped by wordsClean either,
+#but \ + ^ can be inside a word, and so can . (but not .. or ...) and
+#, or : before a digit (as in 3,000 or 10:30, which NLTK doesn't split)
+wordEdge = r'[^' + wordBreaks + r'\\,.:+^]'
+wordInside = r'(?:[^' + wordBreaks + r'.,:]|(?<!\.)\.(?!\.)|[,:](?=\d))'
+#NLTK splits n't from the end of a word (don't > do n't) when it's
+#followed by a space or punctuation, and wordsClean then splits n't itself
+#into n and t; so a word stops before such an n't
+notContraction = r"(?!n't(?:[\s.,;:!?()\[\]{}<>" + '"' + r"*@#$%&«»’“”‘]|$))"
+fastTokens = re.compile(
+    #NLTK's other contractions, e.g. cannot > can not, gonna > gon na
+    r'\b(?:can(?=not\b)|gim(?=me\b)|gon(?=na\b)|got(?=ta\b)|lem(?=me\b)|'
+    r'wan(?=na(?:[\s.,;:!?]|$)))'
+    #@ { }, dashes and curly quotes other than ’ are split off by NLTK but
+    #not stripped, so they are words
+    r'|[@{}“”‘«»‒-―]'
+    #anything else: from the first to the last character that isn't
+    #stripped, in a run of characters that aren't split on
+    r'|' + wordEdge + r'(?:(?:' + notContraction + wordInside + r')*' +
+    notContraction + wordEdge + r')?')
+#\n written out as text (backslash-n) is also split on
+escapedNewline = re.compile(r'\\+n')
+
+def fastWordsClean(text):
+    """
+    Single-pass alternative to wordsClean's NLTK path: one precompiled 
+    regular expression finds the cleaned words directly (the same words
+    word_tokenize + split + strip would leave, in nearly every case) 
+    without building the intermediate token lists. Numbers are dropped, 
+    as in wordsClean.
+    """
+    text = text.lower()
+    if '\\' in text:
+        text = escapedNewline.sub(' ', text)
+    return [w for w in fastTokens.findall(text) if not w.isdigit()]
+
+def wordsClean(text, engine=None):
     """
     Takes input of string of text and turns it into a list of words with 
-    most punctuation removed; used in Rx and keywords searches
+    most punctuation removed; used in Rx and keywords searches.
+    Uses the tokenizer named by engine, or by tokenizerEngine by default 
+    ('nltk' below, or 'fast' for fastWordsClean)
     """
+    if (engine or tokenizerEngine) == 'fast':
+        return fastWordsClean(text)
     wordscl = []
+    import nltk
     tokens = nltk.word_tokenize(text)
     words = [w.lower() for w in tokens if w is not None]
     for word in words:
@@ -195,6 +1568,115 @@ def wordsClean(text):
     #split and strip loops
     return wordscl
 
+class frozenLexicon(object):
+    """
+    Read-only set of words kept in a file, which is memory-mapped instead of
+    read, so that it opens in about a millisecond and its pages are shared
+    by all processes using it. The words are stored sorted, as UTF-8 text
+    with a table of where each one starts, and looked up through a hash 
+    table of their positions (CRC-32 of the word, with linear probing).
+    The stopwords are stored after the words, and loaded into a set as 
+    there are only a few of them.
+    """
+    magic = b'RCALEX1\n'
+    
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.data[:len(self.magic)] != self.magic:
+            raise ValueError("%r is not a lexicon file" % path)
+        view = memoryview(self.data)[len(self.magic):]
+        count, stopCount, slots = view[:12].cast('I')
+        tables = view[12:12+4*(count+stopCount+2+slots)].cast('I')
+        self.offsets = tables[:count+1]
+        stopOffsets = tables[count+1:count+stopCount+2]
+        self.slots = tables[count+stopCount+2:]
+        self.mask = slots-1
+        self.text = len(self.magic)+12+4*len(tables)
+        self.stopWords = set(self.data[self.text+stopOffsets[i]:
+                                       self.text+stopOffsets[i+1]].decode(
+                                           'utf-8', 'surrogatepass')
+                             for i in range(stopCount))
+    
+    @classmethod
+    def build(cls, path, words, stops):
+        """
+        Writes the words and stopwords to a lexicon file at path, and 
+        opens it
+        """
+        words = sorted(set(w.encode('utf-8', 'surrogatepass') for w in words))
+        stops = sorted(set(w.encode('utf-8', 'surrogatepass') for w in stops))
+        slots = 1
+        while slots < 2*len(words):
+            slots *= 2
+        offsets = array('I', [0])
+        for word in words:
+            offsets.append(offsets[-1]+len(word))
+        stopOffsets = array('I', [offsets[-1]])
+        for word in stops:
+            stopOffsets.append(stopOffsets[-1]+len(word))
+        table = array('I', [0])*slots
+        for pos, word in enumerate(words):
+            slot = zlib.crc32(word) & (slots-1)
+            while table[slot]:
+                slot = (slot+1) & (slots-1)
+            table[slot] = pos+1
+        with open(path, 'wb') as f:
+            f.write(cls.magic)
+            f.write(array('I', [len(words), len(stops), slots]).tobytes())
+            f.write(offsets.tobytes())
+            f.write(stopOffsets.tobytes())
+            f.write(table.tobytes())
+            f.write(b''.join(words))
+            f.write(b''.join(stops))
+        return cls(path)
+    
+    def __len__(self):
+        return len(self.offsets)-1
+    
+    def __contains__(self, word):
+        key = word.encode('utf-8', 'surrogatepass')
+        data, offsets, slots, text = self.data, self.offsets, self.slots, self.text
+        slot = zlib.crc32(key) & self.mask
+        while True:
+            pos = slots[slot]
+            if not pos:
+                return False
+            if data[text+offsets[pos-1]:text+offsets[pos]] == key:
+                return True
+            slot = (slot+1) & self.mask
+    
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.data[self.text+self.offsets[i]:
+                            self.text+self.offsets[i+1]].decode(
+                                'utf-8', 'surrogatepass')
+
+def loadLexicon(path=None):
+    """
+    Loads the English words (lowercased) and stopwords used to find 
+    uncommon words and keywords into wordList and stopWords, if they aren't
+    loaded yet, and returns them. With a path (by default lexiconPath), 
+    they're loaded from the frozenLexicon there, which is built from the 
+    NLTK corpora the first time; otherwise from the NLTK corpora, which
+    takes a few seconds.
+    """
+    global wordList, stopWords
+    if wordList is None:
+        path = path or lexiconPath
+        if path and os.path.exists(path):
+            lexicon = frozenLexicon(path)
+            wordList, stopWords = lexicon, lexicon.stopWords
+        else:
+            from nltk.corpus import stopwords
+            from nltk.corpus import words as wordlist
+            words = set(word.lower() for word in wordlist.words())
+            stops = set(stopwords.words('english'))
+            if path:
+                frozenLexicon.build(path, words, stops)
+            wordList, stopWords = words, stops
+    return wordList, stopWords
+
 def uncommonWords(words):
     """
     Creates a list of words *not* in English wordlist (NLTK) & not stopwords 
@@ -203,28 +1685,134 @@ def uncommonWords(words):
     number of loops and comparisons needed in subsequent functions.
     (Unfortunately, UK spellings don't seem to be included in wordlist).
     This takes a little longer to run than other functions. 
-    Can be run for full Reddit corpus or for individual Reddit authors
+    Can be run for full Reddit corpus or for individual Reddit authors.
+    Words can also be given as an array of ids (see corpusIds); then each
+    distinct word is only tested once in the run, and kept in a mask.
     """
-    redditWords = []
+    wordList, stopWords = loadLexicon()
+    test = lambda word: uncommonWord(word, wordList, stopWords)
+    if isIds(words):
+        import numpy as np
+        present = np.zeros(len(corpusVocabulary), bool)
+        for start, chunk in idChunks(words):
+            present[chunk] = True
+        found = present & corpusVocabulary.mask('uncommon', test)
+        return sorted(corpusVocabulary.words[i] 
+                      for i in np.flatnonzero(found))
     words = set(w for w in words)
     #Could also be restricted to just alphabetic words using the w.isalpha()
     #method, but want to keep hyphenated words and this would exclude them
-               
-    uncommonWords = words - wordList - stopWords
-    
-    for word in uncommonWords:  #Basic "sledgehammer" check for plurals: 
-        try:                    #subtracts final letter from each word in Reddit
-                                #corpus and check to see if that word is in 
-                                #imported word list, b/c word list does not 
-                                #contain (any?) plurals
-            if word[-1] is not 's' or word[0:-1] not in wordList: 
-                    redditWords.append(word)
-        except:
-            continue
+    return sorted(w for w in words if test(w))
+
+def uncommonWord(word, wordList, stopWords):
+    """
+    Whether a word is neither in the English word list nor a stopword 
+    (see uncommonWords)
+    """
+    if not word or word in stopWords or word in wordList:
+        return False
+    #Basic "sledgehammer" check for plurals: subtracts final letter from 
+    #each word in Reddit corpus and check to see if that word is in 
+    #imported word list, b/c word list does not contain (any?) plurals
+    return word[-1] != 's' or word[0:-1] not in wordList
+
+#Table for removing vowels from a word with str.translate
+noVowels = str.maketrans('', '', 'aeiou')
+
+class rxIndex(object):
+    """
+    Prebuilt misspelling index for one treatment dictionary, used by 
+    redditRx. Each treatment name and variant is stored under two keys: its
+    letters in sorted order, with and without vowels (the comparison keys 
+    redditRx has always used; see below). A word then matches a treatment 
+    if its own letters without vowels, or its letters with any one letter 
+    removed, sort into one of these keys. In the spirit of SymSpell's 
+    precomputed deletions, the dictionary side is computed once and 
+    looking up a word only takes one hash lookup per letter of the word, 
+    however large the dictionary is. Can be saved to disk and loaded again
+    (see treatmentIndex).
+    """
+    def __init__(self, treatments=None):
+        self.keys = {} #sorted letters -> position, in order of first use
+        self.names = [] #position -> treatment name
+        self.lengths = set() #lengths of the keys, to skip impossible words
+        self.fingerprint = None
+        self.variants = 0 #misspelling variants generated by lookup so far
+        if treatments is not None:
+            self.fingerprint = json.dumps(list(treatments.items()))
+            for k,v in treatments.items():
+                for rx in v:
+                    for variant in (rx, rx.translate(noVowels)):
+                        self.addKey(''.join(sorted(variant)), k)
+    
+    def addKey(self, key, name):
+        #as in the original nested lists, a key shared by two treatments
+        #belongs to the first one
+        if key not in self.keys:
+            self.keys[key] = len(self.names)
+            self.names.append(name)
+            self.lengths.add(len(key))
+    
+    def lookup(self, word):
+        """
+        Positions of the keys that the word matches (possibly none)
+        """
+        found = set()
+        key = ''.join(sorted(word.translate(noVowels)))
+        if key in self.keys:
+            found.add(self.keys[key])
+        length = len(word)-1 if len(word) > 1 else len(word)
+        if length in self.lengths:
+            #removing a letter from the sorted letters gives the same key 
+            #as sorting the word with that letter removed
+            variants = set(extraConsonant(''.join(sorted(word))))
+            self.variants += len(variants)
+            for key in variants:
+                if key in self.keys:
+                    found.add(self.keys[key])
+        return found
+    
+    def save(self, path):
+        with open(path, 'w', encoding='utf-8') as out:
+            json.dump({'fingerprint': self.fingerprint, 
+                       'keys': [[key, self.names[pos]] 
+                                for key, pos in self.keys.items()]}, out)
     
-    return sorted(redditWords)
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding='utf-8') as saved:
+            data = json.load(saved)
+        index = cls()
+        index.fingerprint = data['fingerprint']
+        for key, name in data['keys']:
+            index.addKey(key, name)
+        return index
 
-def redditRx(words):
+#Misspelling indexes already built, by treatment dictionary
+rxIndexes = {}
+
+def treatmentIndex(treatments, path=None):
+    """
+    Returns the rxIndex for a treatment dictionary, building it only the
+    first time it's needed. With a path, the index is loaded from that 
+    file if it was saved there for the same dictionary, and otherwise 
+    built and saved there for the next run.
+    """
+    fingerprint = json.dumps(list(treatments.items()))
+    index = rxIndexes.get(fingerprint)
+    if index is None:
+        if path and os.path.exists(path):
+            index = rxIndex.load(path)
+            if index.fingerprint != fingerprint:
+                index = None
+        if index is None:
+            index = rxIndex(treatments)
+            if path:
+                index.save(path)
+        rxIndexes[fingerprint] = index
+    return index
+
+def redditRx(words, index=None, treatments=None):
     """
     Takes as input list output from uncommonWords function. Compares words
     to words in the appropriate treatment dictionary defined above.
@@ -235,59 +1823,35 @@ def redditRx(words):
     This is meant to capture a non-exhaustive but large percentage of 
     misspellings without manually inputting a list of misspellings. Can
     also be run for individual authors.
+    The treatment names, with and without vowels, are compared by their
+    letters in sorted order (as with the Index method from the NLTK book 
+    ch. 5), using the prebuilt rxIndex of the community's treatment 
+    dictionary (or the given index).
     """
-    barewords = []
-    barewords1 = defaultdict(list)
-    RxListNoVowels = []
-    RxListNoVowels1 = defaultdict(list)
-    vowels = ['a','e','i','o','u']
+    if index is None and treatments is None:
+        raise TypeError("redditRx needs the community's treatments (or "
+                        "their rxIndex)")
+    if index is None:
+        index = treatmentIndex(treatments)
     words = list(set(words))
     rxDictNew = defaultdict(list)
-
-    #This loop creates a new list of words variations with vowels removed
-    #and each letter removed once to match misspellings in vowels and 
-    #some misspellings with consonants (some redundancies arise and 
-    #efficiency and scope could be improved, but a lot is captured)
+    
+    #Words are grouped by the treatment key they match; going through the
+    #keys in dictionary order, each match is added to a new default 
+    #dictionary to later turn into a bar chart
+    matches = defaultdict(list)
+    variants = index.variants
     for word in words:
-        bareword = word
-        for vowel in vowels:
-            bareword = bareword.replace(vowel,"") #removes vowels from words
-        barewords.append((bareword, word))          
-        xtraclist = list(extraConsonant(word)) #Calls function below
-        for x in xtraclist:                     #which generates a list
-            barewords.append((x,word))          #of variants for the current
-                                                #word with each of its letters
-                                                #removed once
-    
-    #The Index method, which sorts words by their letters (in this case
-    #with vowels or one letter removed) is from the NLTK book ch. 5; it is 
-    #used again below for the list of treatments
-    barewords1 = nltk.Index((''.join(sorted(w)), x) for (w, x) in barewords)
-    
-    #A list of treatments from the treatment dictionary with and without
-    #vowels is also created as a comparator for the words in Reddit posts
-    #processed above
-    for k,v in treatmentDict.items():
-        for rx in v:
-            RxNoVowels = rx
-            for vowel in vowels:
-                RxNoVowels = RxNoVowels.replace(vowel,"")
-            RxListNoVowels.append((rx, k))
-            RxListNoVowels.append((RxNoVowels, k))
-        
-    RxListNoVowels1 = nltk.Index((''.join(sorted(w)),x) for (w,x) 
-    in RxListNoVowels)
-        
-    #In this last loop, the two lists are compared: the list of treatments
-    #(with and without vowels) and the list of uncommon words from Reddit 
-    #posts (without vowels and each consonant removed). When there's a match
-    #it's added to a new default dictionary to later turn into a bar chart
-    for Rx1,Rx2 in RxListNoVowels1.items():
-        for value in barewords1[Rx1]:
-            if value:
-                if value not in rxDictNew[Rx2[0]]:
-                    rxDictNew[Rx2[0]].append(value)
-
+        if word:
+            for pos in index.lookup(word):
+                matches[pos].append(word)
+    countEvent('rx_words', len(words))
+    countEvent('rx_variants', index.variants - variants)
+    for pos in sorted(matches):
+        for value in matches[pos]:
+            if value not in rxDictNew[index.names[pos]]:
+                rxDictNew[index.names[pos]].append(value)
+    
     return rxDictNew
 
 def extraConsonant(word):
@@ -302,55 +1866,626 @@ def extraConsonant(word):
             i+=1
             yield word[:i-1] + word[i:]
 
-def treatmentCount(words, treatm):
+class treatmentScanner(object):
     """
-    Takes as input 1) the list of treatments (output of redditRx function) and 
-    2) the full Reddit corpus text. Returns a dictionary with counts of how 
-    many times each treatment appears in the full text.
+    Phrase matcher for counting treatment mentions in a list of words. 
+    The patterns are the variants and misspellings found by redditRx plus
+    the names in the treatment dictionary, which are split into words the
+    same way as the posts, so that names of several words (e.g. 
+    'dimethyl fumarate') are matched as a sequence of words. 
+    Patterns are kept in a hash table of word tuples, and for each first 
+    word the lengths of the patterns starting with it, longest first; so 
+    scanning the words takes one pass, with one lookup per word plus one
+    for each pattern length starting with that word.
     """
-    treatmentNum = defaultdict(int)
+    def __init__(self, treatm, treatments=None):
+        self.phrases = {}
+        self.lengths = defaultdict(set)
+        for k,v in treatm.items():
+            for word in v:
+                self.addPhrase((word,), k)
+        if treatments:
+            for k,v in treatments.items():
+                for rx in v:
+                    phrase = tuple(wordsClean(rx))
+                    if phrase:
+                        self.addPhrase(phrase, k)
+        self.lengths = dict((word, sorted(lengths, reverse=True)) 
+                            for word, lengths in self.lengths.items())
+    
+    def addPhrase(self, phrase, name):
+        names = self.phrases.setdefault(phrase, [])
+        if name not in names:
+            names.append(name)
+        self.lengths[phrase[0]].add(len(phrase))
+    
+    def scan(self, words):
+        """
+        Yields the list of treatment names of each match in words, going 
+        from left to right. Where patterns of different lengths start at 
+        the same word, the longest one is matched and the scan continues 
+        after it.
+        """
+        if not isinstance(words, (list, tuple)):
+            words = list(words)
+        lengths = self.lengths
+        phrases = self.phrases
+        i = 0
+        end = len(words)
+        while i < end:
+            found = lengths.get(words[i])
+            step = 1
+            if found is not None:
+                for length in found:
+                    if length == 1:
+                        yield phrases[(words[i],)]
+                        break
+                    phrase = tuple(words[i:i+length])
+                    if phrase in phrases:
+                        yield phrases[phrase]
+                        step = length
+                        break
+            i += step
+    
+    def count(self, words, weights=None):
+        """
+        Returns a dictionary with counts of how many times each treatment 
+        appears in words, in the order they're first found. Words can also
+        be an array of corpusVocabulary ids (see scanIds). With weights
+        (one per word, see tokenWeights), each match counts as the weight 
+        of its first word.
+        """
+        treatmentNum = defaultdict(int)
+        if weights is not None:
+            if not isIds(words):
+                words = corpusVocabulary.encode(words)
+            for i, names in self.matchIds(words):
+                for k in names:
+                    treatmentNum[k]+=weights[i]
+            for k in treatmentNum:
+                treatmentNum[k] = weightedCount(treatmentNum[k])
+            return treatmentNum
+        scan = self.scanIds(words) if isIds(words) else self.scan(words)
+        for names in scan:
+            for k in names:
+                treatmentNum[k]+=1
+        return treatmentNum
+    
+    def scanIds(self, ids):
+        """
+        Same as scan, for an array of corpusVocabulary ids (see matchIds)
+        """
+        for i, names in self.matchIds(ids):
+            yield names
     
+    def matchIds(self, ids):
+        """
+        Yields the position and the list of treatment names of each match
+        in an array of corpusVocabulary ids, as scan does for words: the 
+        patterns are turned into ids, and only the positions where a 
+        pattern starts (found with NumPy) are looked at.
+        """
+        import numpy as np
+        lookup = corpusVocabulary.lookup
+        phrases = {}
+        lengths = defaultdict(set)
+        for phrase, names in self.phrases.items():
+            if all(w in lookup for w in phrase):
+                phrase = tuple(lookup[w] for w in phrase)
+                phrases[phrase] = names
+                lengths[phrase[0]].add(len(phrase))
+        if not phrases:
+            return
+        lengths = dict((i, sorted(l, reverse=True)) 
+                       for i, l in lengths.items())
+        firsts = list(lengths)
+        following = 0
+        for start, chunk in idChunks(ids):
+            starts = np.flatnonzero(np.isin(chunk, firsts)) + start
+            for i in starts.tolist():
+                if i < following:
+                    continue
+                first = int(ids[i])
+                for length in lengths[first]:
+                    if length == 1:
+                        yield i, phrases[(first,)]
+                        break
+                    phrase = tuple(ids[i:i+length].tolist())
+                    if phrase in phrases:
+                        yield i, phrases[phrase]
+                        following = i + length
+                        break
+
+def treatmentCount(words, treatm, treatments, weights=None):
+    """
+    Takes as input 1) the full Reddit corpus text and 2) the list of 
+    treatments (output of redditRx function). Returns a dictionary with 
+    counts of how many times each treatment appears in the full text,
+    including names of several words from the community's treatment 
+    dictionary. The counts are drawn by treatmentPlot.
+    Mentions can be weighted, with a weight per word (see tokenWeights).
+    """
     #count number of times a treatment name, including its variants and
     #misspellings, appear in the corpus
-    for word in words:
-        for k,v in treatm.items():
-            if word in treatm[k]:
-                treatmentNum[k]+=1
+    return treatmentScanner(treatm, treatments).count(words, weights)
+
+class treatmentMentions(object):
+    """
+    Which treatments are mentioned together, for a postStore or a 
+    tokenCorpus and the treatments found in it (output of redditRx), as 
+    SciPy sparse matrices with one column per key of the community's 
+    treatment dictionary, in dictionary order. The corpus is
+    scanned once (as by treatmentCount) into the post x treatment matrix
+    `posts` of mention counts; the author x treatment matrix `authors` is
+    its product with the (sparse) author x post matrix. Co-mentions and
+    switch candidates are products of these, so memory grows with the 
+    number of mentions, never with posts x treatments.
+    """
+    def __init__(self, threadz, treatm, treatments):
+        import numpy as np
+        from scipy import sparse
+        self.names = list(treatments)
+        column = dict((k, i) for i, k in enumerate(self.names))
+        ids = corpusIds(threadz)
+        offsets = corpusOffsets(threadz)
+        rows = array('q')
+        cols = array('l')
+        for i, names in treatmentScanner(treatm, treatments).matchIds(ids):
+            for k in names:
+                rows.append(i)
+                cols.append(column[k])
+        #the post each match starts in
+        rows = np.searchsorted(offsets, np.frombuffer(rows, dtype='q'), 
+                               'right') - 1
+        cols = np.frombuffer(cols, dtype='l')
+        n = len(threadz)
+        self.posts = sparse.csr_matrix((np.ones(len(rows), dtype=np.int64),
+                                        (rows, cols)), 
+                                       shape=(n, len(self.names)))
+        self.authorNames = threadz.authorNames
+        self.authorIds = np.asarray(threadz.authorIds, dtype=np.int64)
+        self.created = np.asarray(threadz.created, dtype=np.int64)
+        self.authors = self.byAuthor(np.arange(n)) @ self.posts
+    
+    def byAuthor(self, rows):
+        """
+        Sparse author x post matrix with a 1 for each of the rows, at its
+        author
+        """
+        import numpy as np
+        from scipy import sparse
+        return sparse.csr_matrix((np.ones(len(rows), dtype=np.int64),
+                                  (self.authorIds[rows], rows)),
+                                 shape=(len(self.authorNames), 
+                                        self.posts.shape[0]))
+    
+    @staticmethod
+    def binary(matrix):
+        """
+        1 wherever the matrix isn't 0
+        """
+        matrix = matrix.tocsr(copy=True)
+        matrix.data[:] = 1
+        return matrix
     
+    def coMentions(self, level='posts'):
+        """
+        Treatment x treatment matrix of the number of posts (or, with 
+        level='authors', of authors) mentioning both treatments; the 
+        diagonal is the number mentioning each one
+        """
+        incidence = self.binary(self.posts if level == 'posts' 
+                                else self.authors)
+        return (incidence.T @ incidence).tocsr()
+    
+    def switches(self):
+        """
+        Switch candidates: treatment x treatment matrix of the number of
+        authors who mention the first treatment only in the earlier half 
+        of their posts mentioning treatments, and the second one only in 
+        the later half (for an odd number of posts, the middle one is in
+        neither)
+        """
+        import numpy as np
+        rows = np.flatnonzero(self.posts.getnnz(axis=1))
+        order = np.lexsort((self.created[rows], self.authorIds[rows]))
+        rows = rows[order]
+        authors = self.authorIds[rows]
+        counts = np.bincount(authors, minlength=len(self.authorNames))
+        starts = np.cumsum(counts) - counts
+        rank = np.arange(len(rows)) - starts[authors]
+        n = counts[authors]
+        early = self.binary(self.byAuthor(rows[2*rank < n-1]) @ self.posts)
+        late = self.binary(self.byAuthor(rows[2*rank > n-1]) @ self.posts)
+        both = early.multiply(late)
+        return ((early - both).T @ (late - both)).tocsr()
+    
+    def pairs(self, matrix, n=None):
+        """
+        The (treatment, treatment, count) pairs of a treatment x treatment
+        matrix with a count, leaving out the diagonal, highest counts 
+        first (the first n)
+        """
+        import numpy as np
+        matrix = matrix.tocoo()
+        keep = (matrix.row != matrix.col) & (matrix.data > 0)
+        rows, cols, data = matrix.row[keep], matrix.col[keep], \
+                           matrix.data[keep]
+        order = np.lexsort((cols, rows, -data))[:n]
+        return [(self.names[r], self.names[c], d) for r, c, d in 
+                zip(rows[order].tolist(), cols[order].tolist(), 
+                    data[order].tolist())]
+
+def writeCoMentions(mentions, path):
+    """
+    Writes each pair of treatments mentioned together to a CSV file: the 
+    number of posts and of authors mentioning both, and of authors 
+    switching from the first to the second (see treatmentMentions)
+    """
+    posts = mentions.coMentions('posts').todok()
+    authors = mentions.coMentions('authors').todok()
+    switches = mentions.switches().todok()
+    pairs = sorted(set(posts.keys()) | set(authors.keys()) | 
+                   set(switches.keys()))
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        out = csv.writer(f)
+        out.writerow(['treatment', 'other', 'posts', 'authors', 'switches'])
+        for r, c in pairs:
+            if r != c:
+                out.writerow([mentions.names[r], mentions.names[c], 
+                              int(posts.get((r, c), 0)), 
+                              int(authors.get((r, c), 0)),
+                              int(switches.get((r, c), 0))])
+
+def coMentionReport(j, treatments, variations, path, out=None):
+    """
+    Writes the treatments mentioned together in the posts of j to a CSV 
+    file at path (see writeCoMentions), and prints the likely switches 
+    from one treatment to another. The treatment variations are those 
+    the report already found (the variations of its reportData), so the 
+    corpus isn't searched for them again.
+    """
+    with profileStage('treatmentMentions'):
+        mentions = treatmentMentions(j, variations, treatments)
+        writeCoMentions(mentions, path)
+    print("", file=out)
+    print("Treatments mentioned together written to %s" % path, file=out)
+    print("", file=out)
+    print("LIKELY TREATMENT SWITCHES (AUTHORS)", file=out)
+    for first, second, count in mentions.pairs(mentions.switches(), 10):
+        print("%s -> %s: %d" % (first, second, count), file=out)
+
+def showPlot(path=None):
+    """
+    Shows the chart being drawn, or saves it as an image file at path
+    """
+    from matplotlib import pyplot as plt
+    plt.xticks(rotation=65)
+    if path:
+        plt.savefig(path, bbox_inches='tight')
+        plt.close()
+    else:
+        plt.show()
+
+def treatmentPlot(treatmentNum, name=None, path=None):
+    """
+    Bar chart of the treatment counts from treatmentCount for the 
+    subreddit name; it's saved at path if one is given (see showPlot).
+    """
+    from matplotlib import pyplot as plt
     names = list(treatmentNum.keys())
     counts = list(treatmentNum.values())
+    plt.figure()
     plt.bar(names,counts)
-    plt.suptitle('Treatments mentioned in %r Subreddit' % subreddit.display_name)
-    plt.xticks(rotation=65)
-    plt.show()
+    plt.suptitle('Treatments mentioned in %r Subreddit' % name)
+    showPlot(path)
+
+class activityHistogram(object):
+    """
+    Number of posts and comments per hour, day or week (UTC; weeks start
+    on Monday), for the whole corpus and for each author, counted with 
+    NumPy from the epoch timestamps of the posts in one pass. counts holds
+    the corpus histogram, starts the epoch time each bucket starts at, and
+    the authors' histograms are kept sparse (only their buckets with posts,
+    sorted by author) and expanded by author().
+    """
+    bucketSeconds = {'hour': 3600, 'day': 86400, 'week': 7*86400}
+    #strftime format of the bucket labels
+    bucketFormats = {'hour': '%b %d, %Y %H:00', 'day': '%b %d, %Y', 
+                     'week': 'week of %b %d, %Y'}
+    #the epoch (Jan 1 1970) was a Thursday, 3 days after a Monday
+    bucketOffsets = {'hour': 0, 'day': 0, 'week': -3*86400}
+    
+    def __init__(self, created, authors=None, names=None, bucket='day'):
+        """
+        created: epoch timestamps, authors: the author number of each post
+        (optional) and names: the author name of each number
+        """
+        import numpy as np
+        if bucket not in self.bucketSeconds:
+            raise ValueError("Unknown bucket %r (choose from %s)" % 
+                             (bucket, ', '.join(self.bucketSeconds)))
+        self.bucket = bucket
+        size = self.bucketSeconds[bucket]
+        offset = self.bucketOffsets[bucket]
+        created = np.asarray(created, dtype=np.int64)
+        if len(created):
+            first = (created.min() - offset)//size
+            buckets = (created - offset)//size - first
+            self.counts = np.bincount(buckets)
+        else:
+            first = 0
+            buckets = created
+            self.counts = np.zeros(0, dtype=np.int64)
+        self.starts = (np.arange(len(self.counts), dtype=np.int64) + first)\
+                      *size + offset
+        self.names = names or []
+        self.lookup = dict((a, i) for i, a in enumerate(self.names))
+        if authors is not None and len(created):
+            #one key per (author, bucket) pair with posts; np.unique sorts
+            #them by author, then bucket
+            keys = np.asarray(authors, dtype=np.int64)*len(self.counts) + \
+                   buckets
+            keys, authorCounts = np.unique(keys, return_counts=True)
+            self.authorBuckets = keys % len(self.counts)
+            self.authorCounts = authorCounts
+            self.authorStarts = np.searchsorted(
+                keys//len(self.counts), np.arange(len(self.names)+1))
+        else:
+            self.authorBuckets = self.authorCounts = np.zeros(0, np.int64)
+            self.authorStarts = np.zeros(len(self.names)+1, np.int64)
+    
+    @classmethod
+    def fromPosts(cls, threadz, bucket='day'):
+        """
+        Histograms of a postStore, read straight from its columns, or of
+        any other iterable of redditPost records such as the stream from 
+        dumpThreads() (read once)
+        """
+        if isinstance(threadz, postStore):
+            import numpy as np
+            return cls(np.frombuffer(threadz.created, dtype='q'),
+                       np.frombuffer(threadz.authorIds, dtype='l'),
+                       threadz.authorNames, bucket)
+        if isinstance(threadz, tokenCorpus):
+            return cls(threadz.created, threadz.authorIds, 
+                       threadz.authorNames, bucket)
+        created = array('q')
+        authors = array('l')
+        names = []
+        lookup = {}
+        for item in threadz:
+            authorId = lookup.get(item.author)
+            if authorId is None:
+                authorId = lookup[item.author] = len(names)
+                names.append(item.author)
+            created.append(int(item.created))
+            authors.append(authorId)
+        return cls(created, authors, names, bucket)
+    
+    @classmethod
+    def fromCounts(cls, counts, bucket='day'):
+        """
+        Histogram of the corpus from numbers of posts by the epoch time 
+        their bucket starts at (e.g. as kept by an analysisSnapshot)
+        """
+        import numpy as np
+        histogram = cls([], bucket=bucket)
+        if counts:
+            size = cls.bucketSeconds[bucket]
+            first = min(counts)
+            starts = np.arange(first, max(counts)+size, size, dtype=np.int64)
+            histogram.starts = starts
+            histogram.counts = np.array([counts.get(int(t), 0) 
+                                         for t in starts], dtype=np.int64)
+        return histogram
+    
+    def author(self, author):
+        """
+        Histogram of one author's posts, over the same buckets as counts
+        """
+        import numpy as np
+        counts = np.zeros(len(self.counts), dtype=np.int64)
+        i = self.lookup.get(author)
+        if i is not None:
+            start, end = self.authorStarts[i], self.authorStarts[i+1]
+            counts[self.authorBuckets[start:end]] = \
+                self.authorCounts[start:end]
+        return counts
+    
+    def rolling(self, counts=None, window=7):
+        """
+        Rolling sums of a histogram (by default the corpus one): for each 
+        bucket, the number of posts in the `window` (at least 1) buckets 
+        ending with it
+        """
+        import numpy as np
+        if window < 1:
+            raise ValueError("Rolling window must be at least 1 bucket, "
+                             "not %r" % window)
+        if counts is None:
+            counts = self.counts
+        total = np.cumsum(counts)
+        total[window:] = total[window:] - total[:-window]
+        return total
+    
+    def labels(self):
+        """
+        Dates (and hours) of the buckets, as shown on the plot
+        """
+        fmt = self.bucketFormats[self.bucket]
+        return [datetime.utcfromtimestamp(int(t)).strftime(fmt) 
+                for t in self.starts]
 
-def datesPlot(threadz, author=None):
+def datesPlot(threadz, author=None, index=None, name=None, path=None,
+              bucket='day', histogram=None, window=None):
     """
     Creates frequency plot of dates of Reddit posts and comments. Can also 
-    be created for individual author activity.
+    be created for individual author activity. Posts are counted per hour,
+    day or week bucket, in chronological order, by an activityHistogram;
+    one that was already built (with the same bucket) can be passed 
+    instead of reading the posts again, which is how author timelines 
+    avoid rescanning the corpus. Otherwise, the posts are read only once, 
+    so it also accepts the stream from dumpThreads(). With an authorIndex,
+    an author's dates are read from the index instead of the posts.
+    With a window, rolling sums over that many buckets are drawn as well.
+    The plot is titled with the subreddit name, and saved at path if one
+    is given (see showPlot).
     """
-    allDates = defaultdict(int)
-    
-    if author == None:
-        for item in threadz:
-            #Dates are stored in the 3rd "slot" for each post or comment
-            #pulled in by the threads function
-            date = item[2]
-            allDates[date]+=1
+    if window is not None and window < 1:
+        raise ValueError("Rolling window must be at least 1 bucket, not %r"
+                         % window)
+    if histogram is None and author is not None and index is not None:
+        histogram = activityHistogram(index[author].dates, bucket=bucket)
+        counts = histogram.counts
     else:
-        for item in threadz:
-            if item[4] == author:                
-                date = item[2]
-                allDates[date]+=1
+        if histogram is None:
+            histogram = activityHistogram.fromPosts(threadz, bucket)
+        counts = histogram.counts if author is None \
+                 else histogram.author(author)
         
-    names = list(allDates.keys())
-    counts = list(allDates.values())    
+    from matplotlib import pyplot as plt
+    names = histogram.labels()
+    plt.figure()
     plt.bar(names,counts)
-    plt.suptitle('Recent %r Subreddit posts by date' % subreddit.display_name)
-    plt.xticks(rotation=65)
-    plt.show() 
+    if window is not None:
+        plt.plot(names, histogram.rolling(counts, window), color='black')
+    plt.suptitle('Recent %r Subreddit posts by %s' % (name, 
+                                                     histogram.bucket))
+    showPlot(path)
+    
+class keywordCounter(object):
+    """
+    Counts keywords in words given to it a batch at a time (e.g. post by 
+    post, or shard by shard). Stopwords and one-letter words are skipped,
+    as in keywords(). Counters of different shards or time periods can be
+    merged.
+    By default every keyword is counted exactly. With a capacity, only 
+    that many keywords are kept (the Space-Saving algorithm), so memory 
+    stays bounded whatever the size of the vocabulary: a new keyword 
+    replaces the one with the lowest count, and takes over its count as 
+    the possible error of its own. Any keyword more frequent than 
+    (number of words)/capacity is kept, and counts are never too low.
+    """
+    def __init__(self, capacity=None, stopwords=None):
+        self.capacity = capacity
+        self.stopwords = stopwords if stopwords is not None \
+                         else loadLexicon()[1]
+        self.counts = Counter()
+        self.errors = {}
+        self.total = 0
+        #lowest counts first, for finding the keyword to replace; entries
+        #whose count has changed since are skipped when they come up
+        self.lowest = []
+    
+    def update(self, words):
+        """
+        Counts the keywords in words (any iterable of words)
+        """
+        stopw = self.stopwords
+        words = (w for w in words if len(w)>1 and w not in stopw)
+        if self.capacity is None:
+            batch = Counter(words)
+            self.total += sum(batch.values())
+            self.counts.update(batch)
+            return self
+        counts = self.counts
+        for w in words:
+            self.total += 1
+            if w in counts:
+                counts[w] += 1
+                heapq.heappush(self.lowest, (counts[w], w))
+            elif len(counts) < self.capacity:
+                counts[w] = 1
+                self.errors[w] = 0
+                heapq.heappush(self.lowest, (1, w))
+            else:
+                low = self.evict()
+                counts[w] = low+1
+                self.errors[w] = low
+                heapq.heappush(self.lowest, (low+1, w))
+            if len(self.lowest) > 4*self.capacity:
+                self.reheap()
+        return self
+    
+    def evict(self):
+        """
+        Removes the keyword with the lowest count and returns its count
+        """
+        while True:
+            count, w = heapq.heappop(self.lowest)
+            if self.counts.get(w) == count:
+                del self.counts[w]
+                del self.errors[w]
+                return count
+    
+    def reheap(self):
+        self.lowest = [(c, w) for w, c in self.counts.items()]
+        heapq.heapify(self.lowest)
+    
+    def merge(self, other):
+        """
+        Adds the counts of another keywordCounter to this one. For bounded
+        counters, a keyword missing from a full counter may still have 
+        been seen up to its lowest count times, which is added to its 
+        count and error; then only the `capacity` keywords with the highest
+        counts are kept.
+        """
+        self.total += other.total
+        if self.capacity is None and other.capacity is None:
+            self.counts.update(other.counts)
+            return self
+        capacity = self.capacity or other.capacity
+        mine = self.floor()
+        theirs = other.floor()
+        errors = {}
+        merged = Counter()
+        for w in list(self.counts) + [w for w in other.counts 
+                                      if w not in self.counts]:
+            c1 = self.counts.get(w)
+            c2 = other.counts.get(w)
+            merged[w] = (mine if c1 is None else c1) + \
+                        (theirs if c2 is None else c2)
+            errors[w] = (mine if c1 is None else self.errors.get(w, 0)) + \
+                        (theirs if c2 is None else other.errors.get(w, 0))
+        kept = merged.most_common(capacity)
+        self.capacity = capacity
+        self.counts = Counter(dict(kept))
+        self.errors = dict((w, errors[w]) for w, c in kept)
+        self.reheap()
+        return self
+    
+    def floor(self):
+        """
+        Most times a keyword that isn't kept may have been seen: 0 for an 
+        exact counter or one that isn't full yet, otherwise the lowest count
+        """
+        if self.capacity is None or len(self.counts) < self.capacity:
+            return 0
+        return min(self.counts.values())
     
-def keywords(words, n=20):
+    def __iadd__(self, other):
+        return self.merge(other)
+    
+    def __getitem__(self, word):
+        return self.counts.get(word, self.floor())
+    
+    def __len__(self):
+        return len(self.counts)
+    
+    def error(self, word):
+        """
+        How much the count of a keyword may be too high (0 when exact)
+        """
+        return self.errors.get(word, self.floor())
+    
+    def most_common(self, n=20):
+        """
+        The n keywords with the highest counts, with their counts
+        """
+        return self.counts.most_common(n)
+
+def keywords(words, n=20, capacity=None, weights=None):
     """
     Takes as input the output of the redditText function, for either the full
     corpus of Reddit text or for an individual author, and returns the top
@@ -358,24 +2493,147 @@ def keywords(words, n=20):
     common verbs - i.e. "stopwords" then also excludes remaining one-letter 
     words because they are almost always reduced from contractions, 
     e.g. "don't" > do n't > do n t
+    With a capacity, counts are approximate and only use memory for that 
+    many keywords (see keywordCounter). Words can also be an array of 
+    corpusVocabulary ids (see corpusIds), counted with NumPy; ties are 
+    ordered by first appearance either way. Ids can be weighted, with a 
+    weight per word (see tokenWeights), to count e.g. near-duplicate posts
+    only once between them.
+    """
+    import numpy as np
+    if weights is not None and not isIds(words):
+        words = np.frombuffer(corpusVocabulary.encode(words), dtype=np.int32)
+    if isIds(words) and capacity is None:
+        stopw = loadLexicon()[1]
+        keep = corpusVocabulary.mask('keyword', 
+                                     lambda w: len(w)>1 and w not in stopw)
+        if len(words) <= idChunkSize and weights is None:
+            ids, first, counts = np.unique(words, return_index=True, 
+                                           return_counts=True)
+        else:
+            #counted a chunk at a time, over the whole vocabulary
+            size = len(corpusVocabulary)
+            counts = np.zeros(size, np.int64 if weights is None else float)
+            first = np.full(size, len(words), np.int64)
+            for start, chunk in idChunks(words):
+                counts += np.bincount(chunk, None if weights is None else 
+                                      weights[start:start+idChunkSize],
+                                      minlength=size)
+                found, pos = np.unique(chunk, return_index=True)
+                first[found] = np.minimum(first[found], pos + start)
+            ids = np.flatnonzero(counts)
+            first, counts = first[ids], counts[ids]
+        kept = keep[ids]
+        ids, first, counts = ids[kept], first[kept], counts[kept]
+        order = np.lexsort((first, -counts))[:n]
+        count = int if weights is None else weightedCount
+        return [(corpusVocabulary.words[i], count(c)) 
+                for i, c in zip(ids[order].tolist(), counts[order].tolist())]
+    counter = keywordCounter(capacity)
+    if isIds(words):
+        #only the keywords of a chunk of ids are decoded at a time
+        stopw = counter.stopwords
+        keep = corpusVocabulary.mask('keyword', 
+                                     lambda w: len(w)>1 and w not in stopw)
+        for start, chunk in idChunks(words):
+            chunk = np.asarray(chunk)
+            counter.update(corpusVocabulary.decode(
+                chunk[keep[chunk]].tolist()))
+        return counter.most_common(n)
+    return counter.update(words).most_common(n)
+
+class authorPosts(object):
+    """
+    What the authorIndex keeps about one author: the row numbers of their
+    posts and comments, the flair of their first post, the number of posts
+    and the UTC epoch timestamps of those posts
+    """
+    __slots__ = ('rows', 'flair', 'posts', 'dates')
+    
+    def __init__(self, flair=None):
+        self.rows = array('l')
+        self.flair = flair
+        self.posts = 0
+        self.dates = array('q')
+
+class authorIndex(dict):
     """
-    stopw = list(stopWords)
-    wordFD = nltk.FreqDist(w for w in words if w not in stopw and len(w)>1)
-    return wordFD.most_common(n)
+    Dictionary of Reddit authors built in a single pass over the posts: keys
+    are usernames and values are authorPosts entries. Building it once lets
+    the redditor methods look authors up instead of rescanning every post
+    for every author, so profiling all authors takes time proportional to
+    the number of posts. Row numbers refer to positions in the postStore
+    (or list of records) the index was built from.
+    """
+    def __init__(self, threadz=()):
+        dict.__init__(self)
+        if isinstance(threadz, postStore):
+            #reads the store's columns directly instead of row views
+            entries = [None]*len(threadz.authorNames)
+            for row, (a, f, c) in enumerate(zip(threadz.authorIds, 
+                                                threadz.flairIds,
+                                                threadz.created)):
+                entry = entries[a]
+                if entry is None:
+                    entry = authorPosts(threadz.flairNames[f])
+                    entries[a] = entry
+                    self[threadz.authorNames[a]] = entry
+                entry.rows.append(row)
+                entry.posts +=1
+                entry.dates.append(c)
+        elif isinstance(threadz, tokenCorpus):
+            #the rows of each author are found by sorting the author 
+            #column, and kept as NumPy arrays
+            import numpy as np
+            order = np.argsort(threadz.authorIds, kind='stable')
+            ends = np.cumsum(np.bincount(threadz.authorIds, 
+                                         minlength=len(threadz.authorNames)))
+            start = 0
+            for a, end in enumerate(ends.tolist()):
+                entry = authorPosts(threadz.authorFlairs[a])
+                entry.rows = order[start:end]
+                entry.posts = end - start
+                entry.dates = threadz.created[entry.rows]
+                self[threadz.authorNames[a]] = entry
+                start = end
+        else:
+            for row, item in enumerate(threadz):
+                entry = self.get(item.author)
+                if entry is None:
+                    entry = authorPosts(item.flair)
+                    self[item.author] = entry
+                entry.rows.append(row)
+                entry.posts +=1
+                entry.dates.append(item.created)
+    
+    def counts(self, weights=None):
+        """
+        Number of posts per author, in the format of authorCount(); with 
+        weights (one per row), the sum of the weights of their posts
+        """
+        authors = defaultdict(int)
+        for author, entry in self.items():
+            if weights is None:
+                authors[author] = entry.posts
+            else:
+                authors[author] = weightedCount(sum(weights[row] 
+                                                    for row in entry.rows))
+        return authors
 
-def authorCount(threadz): 
+def authorCount(threadz, weights=None): 
     """
     Creates a new dictionary of Reddit authors based on threads function.
     Keys are usernames of Reddit authors and values are number of posts
-    written by that author.
+    written by that author. Also accepts the stream from dumpThreads().
+    Counting is done by building an authorIndex; if one was already built 
+    it can be passed instead of the posts and is reused. Posts can be 
+    weighted, with a weight per row (see nearDuplicates.weights).
     """
-    authors = defaultdict(int)
-    for item in threadz:
-        #Usernames of authors are stored in the 5th "slot" for each post or 
-        #comment pulled in by the threads function
-        author = item[4]
-        authors[author]+=1
-    return authors
+    if isinstance(threadz, tokenCorpus) and weights is None:
+        return threadz.authorCounts()
+    if not isinstance(threadz, authorIndex):
+        threadz = authorIndex(threadz)
+    return threadz.counts(weights)
 
 def topAuthors(authors,n=20):
     """
@@ -393,6 +2651,82 @@ def topAuthors(authors,n=20):
     topauth = [b for (a,b) in topauth]
     return topauth
 
+#What an author's flair says about them, as found by a flairParser: age, 
+#sex (M or F), diagnosis and current treatment(s), each '-' when unknown
+flairInfo = namedtuple('flairInfo', ['age', 'sex', 'dx', 'rx'])
+
+class flairParser(object):
+    """
+    Finds age, sex, diagnosis and treatment in flair, as the getAgeDx, 
+    getGender and getRx methods of redditor do (see there). The patterns 
+    are compiled once, and since the same flair is often used by many 
+    authors, each distinct flair is parsed once: results are kept in an 
+    LRU cache of up to `size` flairs. The treatment is found with redditRx
+    and the community's treatment dictionary.
+    """
+    genderPattern = re.compile("""^(F|f|M|m)[^A-Za-z]|[^A-Za-z](F|f|M|m)[^A-Za-z]""")
+    dxPattern = re.compile('([dD][Xx].*[0-9]+[0-9]+|[Dd]iag.*[0-9]+[0-9]+|[Ss]ince.*[0-9]+)')
+    agePattern = re.compile('^([1-9][0-9])[^0-9]|[^[0-9\']([1-9][0-9])[^0-9]')
+    unknown = flairInfo('-', '-', '-', '-')
+    
+    def __init__(self, treatments, size=4096):
+        self.treatments = treatments
+        self.parse = functools.lru_cache(maxsize=size)(self.parseFlair)
+    
+    def parseFlair(self, flair):
+        """
+        Parses one flair, without the cache (use parse)
+        """
+        if flair is None or flair == "No author info available":
+            return self.unknown
+        gender = '-'
+        gen_search = self.genderPattern.findall(flair)
+        if gen_search:
+            gender = next((item.upper() for item in gen_search[0] if item), 
+                          '-')
+        
+        dx = '-'
+        for item in self.dxPattern.findall(flair):
+            if item:
+                dx = item
+        #age is searched for after removing the diagnosis text (see getAgeDx)
+        age = '-'
+        age_search = self.agePattern.findall(flair.replace(dx,''))
+        if age_search:
+            for item in age_search[0]:
+                if item:
+                    age = item
+        
+        rx = ''
+        rxDict = redditRx(wordsClean(flair), treatments=self.treatments)
+        if rxDict:
+            for key in rxDict:
+                rx = rx + key + ' '
+        else:
+            rx = '-'
+        return flairInfo(age, gender, dx, rx)
+    
+    def parseAll(self, flairs):
+        """
+        Parses every distinct flair in flairs (e.g. of all of the authors)
+        and returns a dictionary of the flairInfo of each
+        """
+        return dict((flair, self.parse(flair)) for flair in set(flairs))
+
+#flairParsers of the treatment dictionaries used so far
+flairParsers = {}
+
+def flairParserFor(treatments):
+    """
+    The flairParser of a treatment dictionary, created the first time and
+    then shared, along with its cache
+    """
+    fingerprint = json.dumps(list(treatments.items()))
+    parser = flairParsers.get(fingerprint)
+    if parser is None:
+        parser = flairParsers[fingerprint] = flairParser(treatments)
+    return parser
+
 class redditor(object):
     """
     This class gathers and organizes information about individual authors
@@ -404,7 +2738,7 @@ class redditor(object):
     or separate author analyses.
     """
     def __init__(self, author, flair=None, posts=0, text=None, rxs=None,
-                 rx=None, gen=None, dx=None):
+                 rx=None, gen=None, dx=None, treatments=None):
         self.author = author #username of Redditor or Reddit author
         self.flair = flair or None #user provided personal information
         self.posts = posts #number of posts by author in time period
@@ -413,41 +2747,55 @@ class redditor(object):
         self.rx = rx or None #treatment author is currently taking
         self.gen = gen or None #gender/sex
         self.dx = dx or None #date of disease diagnosis
+        #treatment dictionary of the author's community
+        if treatments is None:
+            raise TypeError("redditor needs the treatments of the author's "
+                            "community")
+        self.treatments = treatments
         #flair, which can contain age, sex (male or female), treatment and 
         #diagnosis information is only available occasionally, when the 
         #author chooses to include it
     
-    def getInfo(self,thrds):
+    def getInfo(self,thrds,index=None):
         """
         Some communities use "flair" which is a place to store personal 
         information or the type of info in an email signature; it is up to 
         individual Reddit users whether to include Flair. The Psoriasis 
         community does not appear to use Flair at all.
+        The authorIndex, if given, is used instead of searching thrds (as
+        it is for the getPosts, getText and timeline methods).
         """
-        #Author Flair is stored in the 6th "slot" for each post or 
-        #comment pulled in by the threads function
-        self.flair = next((item[5] for item in thrds if item[4]==self.author), 
-                          'No author info available')
+        if index is not None:
+            entry = index.get(self.author)
+            self.flair = entry.flair if entry else 'No author info available'
+        else:
+            self.flair = next((item.flair for item in thrds 
+                               if item.author==self.author), 
+                              'No author info available')
         if self.flair == None:
             self.flair = 'No author info available'
             
     def getFlair(self):
         return self.flair
     
-    def getPosts(self,thrds):
+    def getPosts(self,thrds,index=None):
         """
         Counts the number of posts written by the author
         """
+        if index is not None:
+            if self.author in index:
+                self.posts+=index[self.author].posts
+            return self.posts
         for item in thrds:
-            if item[4] == self.author:
+            if item.author == self.author:
                 self.posts+=1
         return self.posts
     
-    def getText(self, thrds):
+    def getText(self, thrds, index=None):
         """
         Converts text from the author's posts into a list of words 
         """
-        self.text = redditText(thrds, self.author)
+        self.text = redditText(thrds, self.author, index)
         return self.text
     
     def getRxsText(self):
@@ -459,14 +2807,15 @@ class redditor(object):
             print("Must get author text before Rx list (use method: findText)")
             return
         unc = uncommonWords(self.text)
-        self.rxs = redditRx(unc)
+        self.rxs = redditRx(unc, treatments=self.treatments)
         return self.rxs
     
-    def timeline(self,thrds):
+    def timeline(self,thrds,index=None,histogram=None):
         """
-        Plots dates of author posts on a bar chart
+        Plots dates of author posts on a bar chart; with the 
+        activityHistogram of all authors, without reading thrds
         """
-        return datesPlot(thrds, self.author)
+        return datesPlot(thrds, self.author, index, histogram=histogram)
     
     def getKeywords(self):
         """
@@ -488,19 +2837,8 @@ class redditor(object):
             print("""Must get author info before sex, M/F info 
                   (use method: getInfo)""")
             return
-        elif self.flair == "No author info available":
-            self.gen = "-"
-            return self.gen
-        gen_search = re.findall("""^(F|f|M|m)[^A-Za-z]|[^A-Za-z](F|f|M|m)[^A-Za-z]""",
-                                self.flair)
-        if gen_search:
-            for item in gen_search[0]:
-                if item:
-                    self.gen = item.upper()
-                    return self.gen
-        else:
-            self.gen = '-'
-            return self.gen
+        self.gen = flairParserFor(self.treatments).parse(self.flair).sex
+        return self.gen
     
     def getAgeDx(self):
         """
@@ -515,37 +2853,15 @@ class redditor(object):
         if self.flair == None:
             print("Must get author info before age/diagnosis info (use method: getInfo)")
             return
-        elif self.flair == "No author info available":
-            self.age = "-"
-            self.dx = "-"
-            return (self.age, self.dx)
-        dx_search = re.findall('([dD][Xx].*[0-9]+[0-9]+|[Dd]iag.*[0-9]+[0-9]+|[Ss]ince.*[0-9]+)', 
-                               self.flair)
-        if dx_search:
-            for item in dx_search:
-                if item:
-                    self.dx = item
-        else:
-            self.dx = '-'
-        
-        #Search for age after diagnosis info by removing diagnosis text 
-        #from flair text; this eliminates some "false positives" by removing
-        #numbers that could interfere with age search. This is the method
-        #with the most errors in communities outside of Multiple Sclerosis
-        #which use different Flair conventions, e.g. different vocabulary 
-        #for indicating date of diagnosis
-        try:
-            age_search1 = self.flair.replace(self.dx,'')
-        except:
-            age_search1 = self.flair
-        age_search = re.findall('^([1-9][0-9])[^0-9]|[^[0-9\']([1-9][0-9])[^0-9]', 
-                                age_search1)
-        if age_search:
-            for item in age_search[0]:
-                if item:
-                    self.age = item
-        else:
-            self.age = '-'
+        #Age is searched for after diagnosis info by removing diagnosis 
+        #text from flair text; this eliminates some "false positives" by 
+        #removing numbers that could interfere with age search. This is the
+        #method with the most errors in communities outside of Multiple 
+        #Sclerosis which use different Flair conventions, e.g. different 
+        #vocabulary for indicating date of diagnosis (see flairParser)
+        info = flairParserFor(self.treatments).parse(self.flair)
+        self.age = info.age
+        self.dx = info.dx
         return (self.age, self.dx)
     
     def getRx(self):
@@ -556,18 +2872,7 @@ class redditor(object):
         if self.flair == None:
             print("Must get author info before treatment (use method: getInfo)")
             return
-        elif self.flair == "No author info available":
-            self.rx = '-'
-            return self.rx
-        
-        self.rx = ''
-        flair_tokens = wordsClean(self.flair)
-        rxDict = redditRx(flair_tokens)
-        if rxDict:
-            for key in rxDict:
-                self.rx = self.rx + key + ' '
-        else:
-            self.rx = '-'
+        self.rx = flairParserFor(self.treatments).parse(self.flair).rx
         return self.rx
     
     def __repr__(self):
@@ -576,13 +2881,1261 @@ class redditor(object):
     def __str__(self):
         return "Reddit username: " + self.author
 
+#Compact summary of one author, as shown in the top authors table: posts,
+#age, gender, date of diagnosis and current treatment(s) from their flair, 
+#and their top keyword with its count
+authorProfile = namedtuple('authorProfile', ['author', 'posts', 'age', 
+                                             'gender', 'dx', 'rx', 
+                                             'keyword', 'count'])
+
+def authorShards(j, index, authors, shards):
+    """
+    Splits authors into a number of shards with about the same number of 
+    posts in each: authors with the most posts are placed first, each in 
+    the shard with the fewest posts so far. Each shard is given as 
+    (words, authors), and each author as (author, flair, number of posts,
+    ids of the words of the posts), so a shard can be profiled without the
+    postStore and without tokenizing anything again. The ids are the 
+    posts' cached token ids, numbered from 0 within the shard: words lists
+    the words they stand for, which a worker process adds to its own 
+    vocabulary. From a tokenCorpus, words is None and the corpus and the 
+    rows of the posts are given instead, and each worker process maps the
+    corpus to read their ids.
+    """
+    import numpy as np
+    shards = [[] for i in range(max(1, min(shards, len(authors))))]
+    loads = [(0, i) for i in range(len(shards))]
+    for author in sorted(authors, key=lambda a: -index[a].posts):
+        entry = index[author]
+        load, i = heapq.heappop(loads)
+        if isinstance(j, tokenCorpus):
+            ids = (j, entry.rows)
+        else:
+            ids = corpusIds(j, author, index)
+        shards[i].append((author, entry.flair, entry.posts, ids))
+        heapq.heappush(loads, (load + entry.posts, i))
+    if isinstance(j, tokenCorpus):
+        return [(None, shard) for shard in shards]
+    parts = []
+    for shard in shards:
+        ids = [entry[3] for entry in shard]
+        used, local = np.unique(np.concatenate(ids or 
+                                               [np.zeros(0, np.int32)]),
+                                return_inverse=True)
+        local = np.split(local.astype(np.int32), 
+                         np.cumsum([len(i) for i in ids])[:-1])
+        parts.append((corpusVocabulary.decode(used.tolist()),
+                      [entry[:3] + (ids,) 
+                       for entry, ids in zip(shard, local)]))
+    return parts
+
+#Treatment dictionary of the authors being profiled, set in each worker
+#process by profileWorker
+profileTreatments = None
+
+def profileWorker(treatments, lexicon, rxPath):
+    """
+    Sets up a profiling worker process with its own copy of the lexicon 
+    and of the treatment index, loaded once for all of its shards
+    """
+    global profileTreatments, lexiconPath
+    profileTreatments = treatments
+    lexiconPath = lexicon
+    loadLexicon()
+    treatmentIndex(treatments, rxPath)
+
+def profileShard(shard, setup=None):
+    """
+    Profiles the authors of one shard from authorShards, the same way as 
+    the top authors table (see communityReport), and returns their 
+    authorProfiles. The process is set up first with the arguments of 
+    profileWorker if given (pools only take an initializer from Python 
+    3.7). The distinct flairs of the shard are parsed first, in one batch.
+    """
+    import numpy as np
+    if setup is not None:
+        profileWorker(*setup)
+    words, authors = shard
+    if words is not None:
+        remap = np.frombuffer(corpusVocabulary.encode(words), 
+                              dtype=np.int32)
+    profiles = []
+    flairs = flairParserFor(profileTreatments).parseAll(
+        flair for author, flair, posts, ids in authors)
+    for author, flair, posts, ids in authors:
+        info = flairs[flair]
+        if words is None:
+            corpus, rows = ids
+            ids = np.concatenate([corpus.tokenIds(row) for row in rows])
+        else:
+            ids = remap[ids]
+        kw = keywords(ids)
+        keyword, count = kw[0] if kw else ('-', 0)
+        profiles.append(authorProfile(author, posts, info.age, info.sex,
+                                      info.dx, info.rx.strip(), keyword, 
+                                      count))
+    return profiles
+
+def profileAuthors(j, treatments, authors=None, index=None, processes=1,
+                   shards=None, rxPath=None):
+    """
+    Profiles all of the authors in j (a postStore), or the given list of 
+    authors, with the community's treatment dictionary. With processes > 1,
+    the authors are split into shards (by default 4 per process, see 
+    authorShards) which are profiled in a pool of worker processes; each
+    worker loads the lexicon (from lexiconPath if set) and builds or loads
+    the treatment index (from rxPath) once. Returns a list of 
+    authorProfiles, in the same order as topAuthors.
+    """
+    if index is None:
+        index = authorIndex(j)
+    if authors is None:
+        authors = list(index.keys())
+    authors = sorted(authors, key=lambda a: (index[a].posts, a), 
+                     reverse=True)
+    setup = (treatments, lexiconPath, rxPath)
+    #the lexicon and index files are built here (if needed) before the
+    #workers load them
+    if lexiconPath:
+        loadLexicon()
+    profileWorker(*setup)
+    if processes > 1:
+        parts = authorShards(j, index, authors, shards or 4*processes)
+        with ProcessPoolExecutor(processes) as pool:
+            results = list(pool.map(profileShard, parts, 
+                                    [setup]*len(parts)))
+    else:
+        results = [profileShard(shard) 
+                   for shard in authorShards(j, index, authors, 1)]
+    profiles = dict((p.author, p) for shard in results for p in shard)
+    return [profiles[author] for author in authors]
+
+def writeProfiles(profiles, path):
+    """
+    Writes authorProfiles to a CSV file, one author per line
+    """
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        out = csv.writer(f)
+        out.writerow(authorProfile._fields)
+        out.writerows(profiles)
+
+#Shape of one thread's conversation, as measured by commentTree.metrics:
+#posts (including the submission), deepest reply, mean number of direct 
+#replies to posts that have any, and seconds before the submission's first
+#reply (-1 without replies)
+threadMetrics = namedtuple('threadMetrics', ['thread', 'title', 'posts', 
+                                             'depth', 'branching', 
+                                             'first_reply'])
+
+class commentTree(object):
+    """
+    Reply structure of all of the threads of a postStore, kept as NumPy 
+    arrays over its rows instead of as objects: the row each post replies 
+    to (parent, -1 for submissions), how deep it is (depth, 0 for 
+    submissions) and how many posts are in the subtree it starts (size, 
+    counting itself). Comments whose parent isn't in the store (e.g. 
+    deleted, or from a dump without parent ids) are counted as replies to 
+    their submission. Depths and sizes are found one level of the trees at 
+    a time, for all threads at once, so building the tree and its metrics
+    takes a handful of NumPy operations per level rather than Python code 
+    per comment.
+    """
+    def __init__(self, store):
+        import numpy as np
+        self.store = store
+        n = len(store)
+        rows = dict((postId, row) for row, postId in enumerate(store.ids))
+        roots = {}
+        for row, (t, c) in enumerate(zip(store.threadNums, 
+                                         store.commentNums)):
+            if c == 1:
+                roots[t] = row
+        threadNums = store.threadNums
+        parent = np.full(n, -1, dtype=np.int64)
+        for row, (p, t, c) in enumerate(zip(store.parents, threadNums,
+                                            store.commentNums)):
+            if c == 1:
+                continue
+            p = rows.get(p)
+            if p is None or p == row or threadNums[p] != t:
+                p = roots.get(t, -1)
+            parent[row] = p
+        self.parent = parent
+        self.created = np.frombuffer(store.created, dtype='q')
+        self.authors = np.frombuffer(store.authorIds, dtype='l')
+        self.threads = np.frombuffer(threadNums, dtype='l')
+        
+        #depth and root: every post climbs one level per step
+        depth = np.zeros(n, dtype=np.int64)
+        root = np.arange(n)
+        above = parent.copy()
+        for step in range(n):
+            up = np.flatnonzero(above >= 0)
+            if not len(up):
+                break
+            depth[up] += 1
+            root[up] = above[up]
+            above[up] = parent[above[up]]
+        self.depth = depth
+        self.root = root
+        
+        #subtree sizes: each level adds its sizes to the level above
+        size = np.ones(n, dtype=np.int64)
+        order = np.argsort(-depth, kind='stable')
+        levels = np.searchsorted(-depth[order], 
+                                 -np.arange(depth.max() if n else 0, 0, -1))
+        for start, end in zip(levels, list(levels[1:]) + [n]):
+            at = order[start:end]
+            at = at[depth[at] > 0]
+            np.add.at(size, parent[at], size[at])
+        self.size = size
+        
+        replies = np.flatnonzero(parent >= 0)
+        self.children = np.bincount(parent[replies], minlength=n)
+        first = np.full(n, np.iinfo(np.int64).max, dtype=np.int64)
+        np.minimum.at(first, parent[replies], self.created[replies])
+        #seconds from each post to its first reply, -1 without replies
+        self.firstReply = np.where(self.children > 0, first - self.created,
+                                   -1)
+    
+    def __len__(self):
+        return len(self.parent)
+    
+    def metrics(self):
+        """
+        threadMetrics of each thread, in thread number order
+        """
+        import numpy as np
+        if not len(self):
+            return []
+        threads, inverse = np.unique(self.threads, return_inverse=True)
+        posts = np.bincount(inverse)
+        depth = np.zeros(len(threads), dtype=np.int64)
+        np.maximum.at(depth, inverse, self.depth)
+        replied = np.bincount(inverse, weights=self.children > 0)
+        branching = np.bincount(inverse, weights=self.children) / \
+                    np.maximum(replied, 1)
+        first = np.full(len(threads), -1, dtype=np.int64)
+        roots = np.flatnonzero(self.parent < 0)
+        first[inverse[roots]] = self.firstReply[roots]
+        titles = self.store.titles
+        return [threadMetrics(t, titles.get(t), p, d, round(b, 2), f)
+                for t, p, d, b, f in zip(threads.tolist(), posts.tolist(),
+                                         depth.tolist(), branching.tolist(), 
+                                         first.tolist())]
+    
+    def replyCounts(self):
+        """
+        Who replies to whom: arrays of author numbers (in the store's 
+        authorNames) of the replying author and of the author replied to,
+        and the number of such replies, for each pair of authors
+        """
+        import numpy as np
+        replies = np.flatnonzero(self.parent >= 0)
+        authors = max(1, len(self.store.authorNames))
+        keys = self.authors[replies].astype(np.int64)*authors + \
+               self.authors[self.parent[replies]]
+        keys, counts = np.unique(keys, return_counts=True)
+        return keys // authors, keys % authors, counts
+    
+    def topReplies(self, n=20, selfReplies=False):
+        """
+        The n pairs of authors with the most replies from one to the 
+        other, as (author, replied to, replies), leaving out authors 
+        replying to themselves unless selfReplies
+        """
+        import numpy as np
+        source, target, counts = self.replyCounts()
+        if not selfReplies:
+            keep = source != target
+            source, target, counts = source[keep], target[keep], counts[keep]
+        order = np.argsort(-counts, kind='stable')[:n]
+        names = self.store.authorNames
+        return [(names[s], names[t], c) for s, t, c in 
+                zip(source[order].tolist(), target[order].tolist(),
+                    counts[order].tolist())]
+
+def writeThreadMetrics(metrics, path):
+    """
+    Writes threadMetrics to a CSV file, one thread per line
+    """
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        out = csv.writer(f)
+        out.writerow(threadMetrics._fields)
+        out.writerows(metrics)
+
+def threadReport(j, path, out=None):
+    """
+    Writes the metrics of every thread of j to a CSV file at path (see 
+    commentTree), and prints the pairs of authors who reply to each other
+    most
+    """
+    with profileStage('commentTree'):
+        tree = commentTree(j)
+        metrics = tree.metrics()
+        writeThreadMetrics(metrics, path)
+    print("", file=out)
+    print("Metrics of %d threads written to %s" % (len(metrics), path), 
+          file=out)
+    print("", file=out)
+    print("MOST REPLIES BETWEEN AUTHORS", file=out)
+    for source, target, count in tree.topReplies(10):
+        print("%s -> %s: %d" % (source, target, count), file=out)
+
+#What a community report is made from (see communityData): the subreddit
+#name, number of threads and of posts, activityHistogram of the posts, 
+#treatment counts and variations (as redditRx returns them), top keywords
+#with their counts and the rows of the top authors table (see authorTable)
+reportData = namedtuple('reportData', ['subreddit', 'threads', 'posts', 
+                                       'histogram', 'treatments', 
+                                       'variations', 'keywords', 'authors'])
+
+def communityReport(j, treatments, name, out=None, charts=None, 
+                    weights=None):
+    """
+    Prints the analysis of the posts and comments of the subreddit `name`
+    in j (a postStore), with the community's treatment dictionary: the 
+    six sections listed in its table of contents (see reportSections). 
+    The text is written to the file object out (by default the console) 
+    and the charts of sections 2 and 3 are shown on screen, or, if charts 
+    is a directory, saved in it as dates.png and treatments.png.
+    With weights (one per post, see nearDuplicates.weights), treatments, 
+    keywords and the ranking of the top authors are counted with them.
+    Returns the reportData, which can also be exported (see exportReport).
+    """
+    data = communityData(j, treatments, name, weights)
+    reportSections(data, out, charts)
+    return data
+
+def communityData(j, treatments, name, weights=None):
+    """
+    Counts everything in the report of the posts of j (see communityReport)
+    and returns it as reportData, without printing anything
+    """
+    #call functions to get necessary lists and dictionaries for output
+    #(each measured as a stage, if the run is being profiled)
+    #the words of the corpus are kept as an array of vocabulary ids
+    countEvent('rows', len(j))
+    with profileStage('corpusIds'):
+        jtxt = corpusIds(j)
+    countEvent('tokens', len(jtxt))
+    countEvent('vocabulary', len(corpusVocabulary))
+    with profileStage('uncommonWords'):
+        jwordsunc = uncommonWords(jtxt)
+    countEvent('uncommon_words', len(jwordsunc))
+    with profileStage('redditRx'):
+        jrx = redditRx(jwordsunc, treatments=treatments)
+    #the author index is built once and shared by all of the author lookups
+    with profileStage('authorIndex'):
+        jindex = authorIndex(j)
+        jauthors = authorCount(jindex, weights)
+    countEvent('authors', len(jindex))
+    with profileStage('activityHistogram'):
+        histogram = activityHistogram.fromPosts(j)
+    jweights = None if weights is None else tokenWeights(j, weights)
+    with profileStage('treatmentCount'):
+        treatmentNum = treatmentCount(jtxt, jrx, treatments, jweights)
+    with profileStage('keywords'):
+        jkeyw = keywords(jtxt, weights=jweights)
+    with profileStage('authorTable'):
+        rows = authorTable(j, jindex, treatments, topAuthors(jauthors))
+    
+    maxx = max(j.threadNums) if len(j) else 0
+    return reportData(name, maxx, len(j), histogram, treatmentNum, jrx, 
+                      jkeyw, rows)
+
+def reportSections(data, out=None, charts=None):
+    """
+    Prints the six sections of a community report (see communityReport)
+    from its reportData
+    """
+    name, threadCount, num, histogram, treatmentNum, jrx, jkeyw, rows = data
+    datesPath = treatmentsPath = None
+    if charts:
+        datesPath = os.path.join(charts, 'dates.png')
+        treatmentsPath = os.path.join(charts, 'treatments.png')
+
+    print("", file=out)
+    print("""Table of Contents\n1. Number of posts & comments\n2. Dates of posts
+3. Treatment Counts\n4. Treatment variations and misspellings
+5. Top 20 keywords\n6. Top Authors""", file=out)
+
+    print("", file=out)
+    print("- 1 - ", file=out)
+    print("", file=out)
+    print("Total threads analyzed: %d" % threadCount, file=out)
+    print("Number of Reddit posts & comments analyzed: %d" % num, file=out)
+
+    #prints plot of dates
+    print("", file=out)
+    print("- 2 -", file=out)
+    with profileStage('datesPlot'):
+        datesPlot(None, name=name, path=datesPath, histogram=histogram)
+    if datesPath:
+        print("Chart: %s" % datesPath, file=out)
+
+    #prints list of treatments mentioned, accounting for common misspellings
+    print("", file=out)
+    print("- 3 -", file=out)
+    with profileStage('treatmentPlot'):
+        treatmentPlot(treatmentNum, name, treatmentsPath)
+    if treatmentsPath:
+        for k,v in treatmentNum.items():
+            print(k, v, file=out)
+        print("Chart: %s" % treatmentsPath, file=out)
+
+    print("", file=out)
+    print("- 4 -", file=out)
+    print("", file=out)
+    print("TREATMENT VARIATIONS (& MISSPELLINGS):", file=out)
+    for k,v in jrx.items():
+        print(k, end=": ", file=out)
+        for rx in v:
+            print(rx, end = " ", file=out)
+        print("", file=out)
+
+    #Top 20 keywords for the whole reddit corpus
+    print("", file=out)
+    print("- 5 -", file=out)
+    print("", file=out)
+    print("TOP 20 KEYWORDS       WORD COUNT", file=out)
+    for pos, kv in enumerate(jkeyw):
+        try:
+            spaces = (20 - len(kv[0]))*' '
+        except:
+            spaces = '  '
+        print(str(pos+1)+'.',kv[0],spaces,kv[1], file=out)
+
+    #Here is a basic table showing the top 20 authors with information about them, 
+    #including number of posts, age, gender, date of diagnosis, and top keyword 
+    #they use (plus count of that keyword)
+    print("", file=out)
+    print("- 6 -", file=out)
+    print("", file=out)
+    print("TOP 20 AUTHORS", file=out)
+    print("", file=out)
+    tab = tt.Texttable()
+    headings = ['Author','Posts','Age','Gender','Dx Date','Current Rx','Top Keyword [count]']
+    tab.header(headings)
+    for row in rows:
+        kw, count = row[6:]
+        kw = kw+" ["+str(count)+"]" if kw is not None else '-'
+        tab.add_row(list(row[:6]) + [kw])
+
+    author_table = tab.draw()
+    print (author_table, file=out)
+
+#Formats each section of a report can be exported in (see exportReport)
+exportFormats = ('csv', 'ndjson', 'parquet')
+
+def writeTable(columns, path, fmt='csv'):
+    """
+    Writes a table, given as a dictionary of columns (lists of the same 
+    length), to path as CSV (with a header), newline-delimited JSON (one
+    object per row) or Parquet, in one write. Parquet needs the optional 
+    pyarrow package.
+    """
+    names = list(columns)
+    rows = list(zip(*columns.values()))
+    if fmt == 'csv':
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            out = csv.writer(f)
+            out.writerow(names)
+            out.writerows(rows)
+    elif fmt == 'ndjson':
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(''.join(json.dumps(dict(zip(names, row))) + '\n' 
+                            for row in rows))
+    elif fmt == 'parquet':
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError("Exporting to Parquet requires the pyarrow "
+                              "package (pip install pyarrow)")
+        pyarrow.parquet.write_table(pyarrow.table(columns), path)
+    else:
+        raise ValueError("Unknown export format %r (choose from %s)" % 
+                         (fmt, ', '.join(exportFormats)))
+
+def exportReport(data, directory, fmt='csv', profiles=None):
+    """
+    Writes each section of a report (its reportData) to its own file in 
+    directory, in one of the exportFormats: summary (numbers of threads 
+    and posts), dates (the posts per day), treatments (counts), variations
+    (one row per treatment and variation), keywords, top_authors (the 
+    table of the report, with the top keyword and its count in separate 
+    columns) and, given authorProfiles (see profileAuthors), 
+    authors. The charts are drawn off-screen (see offscreenCharts) to 
+    dates.png and treatments.png. Returns the paths written.
+    """
+    os.makedirs(directory, exist_ok=True)
+    histogram = data.histogram
+    tables = {
+        'summary': {'subreddit': [data.subreddit], 
+                    'threads': [int(data.threads)], 
+                    'posts': [int(data.posts)]},
+        'dates': {'start': histogram.starts.tolist(),
+                  'date': histogram.labels(),
+                  'posts': histogram.counts.tolist()},
+        'treatments': {'treatment': list(data.treatments),
+                       'mentions': list(data.treatments.values())},
+        'variations': {'treatment': [k for k, v in data.variations.items()
+                                     for rx in v],
+                       'variation': [rx for k, v in data.variations.items()
+                                     for rx in v]},
+        'keywords': {'rank': list(range(1, len(data.keywords)+1)),
+                     'keyword': [k for k, c in data.keywords],
+                     'count': [c for k, c in data.keywords]},
+        'top_authors': dict((name, [row[i] for row in data.authors])
+                            for i, name in enumerate(
+                                ['author', 'posts', 'age', 'gender', 'dx',
+                                 'rx', 'keyword', 'count']))}
+    if profiles is not None:
+        tables['authors'] = dict((name, [p[i] for p in profiles]) 
+                                 for i, name in 
+                                 enumerate(authorProfile._fields))
+    paths = []
+    for name, columns in tables.items():
+        path = os.path.join(directory, '%s.%s' % (name, fmt))
+        with profileStage('export'):
+            writeTable(columns, path, fmt)
+        paths.append(path)
+    offscreenCharts()
+    datesPath = os.path.join(directory, 'dates.png')
+    treatmentsPath = os.path.join(directory, 'treatments.png')
+    datesPlot(None, name=data.subreddit, path=datesPath, histogram=histogram)
+    treatmentPlot(data.treatments, data.subreddit, treatmentsPath)
+    return paths + [datesPath, treatmentsPath]
+
+def offscreenCharts():
+    """
+    Draws charts with matplotlib's Agg backend, to image files only, so 
+    that a run never waits on a chart window
+    """
+    import matplotlib
+    matplotlib.use('Agg')
+
+def authorTable(j, jindex, treatments, authors):
+    """
+    Rows of the top authors table of communityReport for a list of 
+    authors: author, posts, age, gender, date of diagnosis, current 
+    treatment, top keyword and its count (None for an author without 
+    keywords), found with the redditor class
+    """
+    posts = []
+    age = []
+    gender = []
+    dx = []
+    rx = []
+    kws = []
+    counts = []
+    for author in authors:
+        author = redditor(author, treatments=treatments)
+        author.getInfo(j, jindex)
+        author.getText(j, jindex)
+        posts.append(author.getPosts(j, jindex))
+        a,d = author.getAgeDx()
+        age.append(a)
+        dx.append(d)
+        gender.append(author.getGender())
+        rx.append(author.getRx())
+        kw = author.getKeywords()
+        kw = kw[0] if kw else (None, None)
+        kws.append(kw[0])
+        counts.append(kw[1])
+
+    return list(zip(authors,posts,age,gender,dx,rx,kws,counts))
+
+class analysisSnapshot(object):
+    """
+    Running totals of everything a community report counts, kept in an 
+    SQLite database between runs so that a community polled again and 
+    again is only analyzed once: each new batch of posts (see update) only
+    adds its own counts, skipping posts already counted (by their Reddit 
+    id), and the report is printed from the totals (see report).
+    Kept are the ids of the posts, the numbers of threads and posts, posts
+    per day, the uncommon words found so far and the treatment variations 
+    among them, treatment counts, keyword counts, and each author's flair, 
+    number of posts and keyword counts. An update only inserts new ids and
+    adds to the rows its own posts count, in one transaction (so an 
+    interrupted update leaves the previous totals), and a report reads 
+    only the rows it shows; neither reads or rewrites the whole history.
+    Misspellings are matched word by word (see redditRx), so a variation 
+    first seen in a new batch can only occur in that batch, and the counts
+    are those of a full analysis; except that a phrase split across two 
+    batches isn't counted. Near-duplicates (see nearDuplicates) are only
+    found among the posts of one batch, so a post is counted again if it
+    copies one counted in an earlier batch that isn't in its own batch.
+    """
+    format = 'rca-snapshot-2'
+    #ids (or words) looked up in the database at a time
+    lookupSize = 500
+    
+    def __init__(self, path):
+        self.db = sqlite3.connect(path)
+        try:
+            tables = set(name for name, in self.db.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table'"))
+            if not tables:
+                self.create()
+            meta = dict(self.db.execute('SELECT key, value FROM meta'))
+        except sqlite3.DatabaseError:
+            meta = {}
+        if meta.get('format') != self.format:
+            self.db.close()
+            raise ValueError("%r is not an analysis snapshot" % path)
+    
+    def create(self):
+        #words and flair are kept as UTF-8 bytes (see blob); rows are 
+        #numbered in the order they were first counted, which breaks ties
+        #the way keywords() and keywordCounter do
+        self.db.executescript("""
+            CREATE TABLE meta (key TEXT PRIMARY KEY, value);
+            CREATE TABLE posts (id TEXT PRIMARY KEY) WITHOUT ROWID;
+            CREATE TABLE days (start INTEGER PRIMARY KEY, posts INTEGER);
+            CREATE TABLE uncommon (word BLOB PRIMARY KEY) WITHOUT ROWID;
+            CREATE TABLE variations (treatment TEXT, variation BLOB);
+            CREATE TABLE treatments (treatment TEXT PRIMARY KEY, 
+                                     mentions INTEGER);
+            CREATE TABLE keywords (word BLOB PRIMARY KEY, count INTEGER);
+            CREATE TABLE authors (author TEXT PRIMARY KEY, flair BLOB, 
+                                  posts INTEGER);
+            CREATE TABLE author_keywords (author TEXT, word BLOB, 
+                                          count INTEGER,
+                                          PRIMARY KEY (author, word));""")
+        with self.db:
+            self.db.executemany('INSERT INTO meta VALUES (?, ?)',
+                                [('format', self.format), ('threads', 0),
+                                 ('posts', 0)])
+    
+    @staticmethod
+    def blob(text):
+        #sqlite3 only stores text that is valid UTF-8, and post text from
+        #dumps can have lone surrogates (see postStore)
+        return None if text is None \
+               else text.encode('utf-8', 'surrogatepass')
+    
+    @staticmethod
+    def text(blob):
+        return None if blob is None \
+               else bytes(blob).decode('utf-8', 'surrogatepass')
+    
+    def known(self, table, column, values):
+        """
+        Those of the values that are already in a column of a table
+        """
+        found = set()
+        for i in range(0, len(values), self.lookupSize):
+            chunk = values[i:i+self.lookupSize]
+            found.update(value for value, in self.db.execute(
+                'SELECT %s FROM %s WHERE %s IN (%s)' % 
+                (column, table, column, ', '.join('?'*len(chunk))), chunk))
+        return found
+    
+    def add(self, table, keys, column, counts):
+        """
+        Adds counts, a list of (key values, count) in the order they were
+        first counted, to a column of a table keyed by the columns keys
+        """
+        where = ' AND '.join('%s = ?' % key for key in keys)
+        self.db.executemany('INSERT OR IGNORE INTO %s (%s, %s) VALUES (%s, 0)'
+                            % (table, ', '.join(keys), column, 
+                               ', '.join('?'*len(keys))),
+                            [key for key, count in counts])
+        self.db.executemany('UPDATE %s SET %s = %s + ? WHERE %s' % 
+                            (table, column, column, where),
+                            [(count,) + key for key, count in counts])
+    
+    def update(self, posts, treatments):
+        """
+        Adds the counts of the posts (a postStore, or any iterable of 
+        redditPost records) that aren't in the snapshot yet, with the 
+        community's treatment dictionary, and returns the number of posts 
+        added
+        """
+        records = []
+        batch = []
+        
+        def keepNew():
+            seen = self.known('posts', 'id', [item.id for item in batch])
+            records.extend(item for item in batch if item.id not in seen)
+            del batch[:]
+        
+        for item in posts:
+            batch.append(item)
+            if len(batch) == self.lookupSize:
+                keepNew()
+        keepNew()
+        new = postStore.fromRecords(records)
+        if not len(new):
+            return 0
+        blob = self.blob
+        with self.db as db:
+            db.executemany('INSERT OR IGNORE INTO posts VALUES (?)', 
+                           [(i,) for i in new.ids])
+            self.add('meta', ('key',), 'value', 
+                     [(('threads',), sum(1 for c in new.commentNums 
+                                         if c == 1)),
+                      (('posts',), len(new))])
+            histogram = activityHistogram.fromPosts(new, 'day')
+            self.add('days', ('start',), 'posts',
+                     [((start,), count) for start, count in 
+                      zip(histogram.starts.tolist(), 
+                          histogram.counts.tolist()) if count])
+            
+            words = corpusIds(new)
+            unc = uncommonWords(words)
+            seen = self.known('uncommon', 'word', [blob(w) for w in unc])
+            unc = [w for w in unc if blob(w) not in seen]
+            db.executemany('INSERT OR IGNORE INTO uncommon VALUES (?)',
+                           [(blob(w),) for w in unc])
+            db.executemany('INSERT INTO variations VALUES (?, ?)',
+                           [(k, blob(rx)) for k, variations in 
+                            redditRx(unc, treatments=treatments).items()
+                            for rx in variations])
+            self.add('treatments', ('treatment',), 'mentions',
+                     [((k,), v) for k, v in treatmentCount(
+                         words, self.variations(), treatments).items()])
+            counts = keywordCounter().update(corpusVocabulary.decode(words))
+            self.add('keywords', ('word',), 'count', 
+                     [((blob(w),), c) for w, c in counts.counts.items()])
+            
+            index = authorIndex(new)
+            db.executemany('INSERT OR IGNORE INTO authors VALUES (?, ?, 0)',
+                           [(author, blob(entry.flair)) 
+                            for author, entry in index.items()])
+            self.add('authors', ('author',), 'posts',
+                     [((author,), entry.posts) 
+                      for author, entry in index.items()])
+            for author in index:
+                counts = keywordCounter().update(redditText(new, author, 
+                                                            index))
+                self.add('author_keywords', ('author', 'word'), 'count',
+                         [((author, blob(w)), c) 
+                          for w, c in counts.counts.items()])
+        return len(new)
+    
+    def counted(self, ids):
+        """
+        Whether each of the post ids is already counted, as a list
+        """
+        ids = list(ids)
+        found = self.known('posts', 'id', ids)
+        return [i in found for i in ids]
+    
+    def variations(self):
+        """
+        The treatment variations found so far, as redditRx returns them
+        """
+        rx = defaultdict(list)
+        for k, variation in self.db.execute("""SELECT treatment, variation 
+                                               FROM variations 
+                                               ORDER BY rowid"""):
+            rx[k].append(self.text(variation))
+        return rx
+    
+    def topKeyword(self, author):
+        """
+        The author's most frequent keyword and its count, (None, None) if
+        they have none
+        """
+        row = self.db.execute("""SELECT word, count FROM author_keywords 
+                                 WHERE author = ? 
+                                 ORDER BY count DESC, rowid LIMIT 1""",
+                              (author,)).fetchone()
+        return (self.text(row[0]), row[1]) if row else (None, None)
+    
+    def report(self, treatments, name, out=None, charts=None):
+        """
+        Prints the community report (see communityReport) from the totals,
+        with the community's treatment dictionary, and returns its 
+        reportData
+        """
+        data = self.data(treatments, name)
+        reportSections(data, out, charts)
+        return data
+    
+    def data(self, treatments, name, n=20):
+        """
+        The reportData of the community report from the totals
+        """
+        db = self.db
+        parser = flairParserFor(treatments)
+        meta = dict(db.execute('SELECT key, value FROM meta'))
+        flairs = {}
+        posts = {}
+        for author, flair, count in db.execute("""SELECT author, flair, posts
+                                                  FROM authors ORDER BY 
+                                                  posts DESC, author DESC 
+                                                  LIMIT ?""", (n,)):
+            flairs[author] = self.text(flair)
+            posts[author] = count
+        rows = []
+        for author in topAuthors(posts, n):
+            info = parser.parse(flairs[author] or 'No author info available')
+            kw, count = self.topKeyword(author)
+            rows.append((author, posts[author], info.age, info.sex, info.dx,
+                         info.rx, kw, count))
+        #treatments in dictionary order, as redditRx returns them
+        variations = self.variations()
+        rx = dict((k, variations[k]) for k in treatments if k in variations)
+        days = Counter(dict(db.execute('SELECT start, posts FROM days')))
+        treatmentNum = defaultdict(int, db.execute("""SELECT treatment, 
+                                                      mentions FROM treatments
+                                                      ORDER BY rowid"""))
+        keyw = [(self.text(w), c) for w, c in db.execute(
+            'SELECT word, count FROM keywords ORDER BY count DESC, rowid '
+            'LIMIT ?', (n,))]
+        return reportData(name, meta['threads'], meta['posts'], 
+                          activityHistogram.fromCounts(days, 'day'),
+                          treatmentNum, rx, keyw, rows)
+    
+    def profiles(self, treatments):
+        """
+        authorProfiles of all of the authors (see profileAuthors), from 
+        the totals, in the same order as topAuthors
+        """
+        parser = flairParserFor(treatments)
+        profiles = []
+        for author, flair, posts in self.db.execute(
+                """SELECT author, flair, posts FROM authors 
+                   ORDER BY posts DESC, author DESC""").fetchall():
+            info = parser.parse(self.text(flair) or 
+                                'No author info available')
+            keyword, count = self.topKeyword(author)
+            if keyword is None:
+                keyword, count = '-', 0
+            profiles.append(authorProfile(author, posts, info.age, info.sex,
+                                          info.dx, info.rx.strip(), keyword,
+                                          count))
+        return profiles
+    
+    def close(self):
+        self.db.close()
+
+###########################
+
+#Batch mode analyzes several communities without asking anything, each in 
+#its own worker process, and writes each report to files. A reportJob is 
+#one subreddit to analyze, with its treatment dictionary, the number of 
+#threads to analyze and the directory its report is written to
+reportJob = namedtuple('reportJob', ['subreddit', 'treatments', 'n', 
+                                     'directory'])
+
+def parseJobs(specs, n=20, outDir='reports'):
+    """
+    Turns batch job specifications into reportJobs. A job is the name of one
+    of the communities (e.g. Diabetes), or SUBREDDIT:COMMUNITY to analyze 
+    another subreddit with a community's treatment dictionary (e.g. 
+    MSsupport:MultipleSclerosis); with no jobs, all four communities are 
+    analyzed. Each report goes in a directory named after the subreddit 
+    in outDir.
+    """
+    known = dict((name.lower(), treatments) 
+                 for name, treatments in communities)
+    jobs = []
+    for spec in specs or [name for name, treatments in communities]:
+        sub, sep, community = spec.partition(':')
+        key = (community or sub).lower()
+        if key not in known:
+            raise ValueError("Unknown community %r (choose from %s)" % 
+                             (community or sub, 
+                              ', '.join(name for name, t in communities)))
+        jobs.append(reportJob(sub, known[key], n, os.path.join(outDir, sub)))
+    return jobs
+
+#Options of the batch run, set in each worker process by batchWorker
+batchOptions = {}
+
+def batchWorker(options):
+    """
+    Sets up a batch worker process for the options of the batch run: 
+    charts are drawn without a display, and the Reddit settings, tokenizer
+    and lexicon file of the batch run are used. Done by runJob, as pools 
+    only take an initializer from Python 3.7.
+    """
+    global redditSettings, tokenizerEngine, lexiconPath
+    offscreenCharts()
+    batchOptions.update(options)
+    redditSettings = options.get('settings') or {}
+    tokenizerEngine = options.get('tokenizer') or tokenizerEngine
+    lexiconPath = options.get('lexicon')
+
+def runJob(job, options=None):
+    """
+    Sets up the process for the options of the batch run (see batchWorker)
+    if given, then reads the posts of one reportJob from the dump files of
+    the batch run, or fetches them from Reddit, and writes its report to 
+    report.txt, dates.png and treatments.png in the job's directory. 
+    Returns the number of posts and comments analyzed.
+    """
+    if options is not None:
+        batchWorker(options)
+    os.makedirs(job.directory, exist_ok=True)
+    global runProfile
+    if batchOptions.get('profile'):
+        runProfile = profilerOf(os.path.join(job.directory, 'profile.json'),
+                                **batchOptions['profile'])
+    rxPath = None
+    if batchOptions.get('rx_index'):
+        #each community has its own treatment dictionary, so its own index
+        rxPath = os.path.join(job.directory, 'rx_index.json')
+    treatmentIndex(job.treatments, rxPath)
+    corpusPath = None
+    if batchOptions.get('write_corpus'):
+        corpusPath = os.path.join(job.directory, 'corpus')
+    if batchOptions.get('dump') and corpusPath:
+        with profileStage('dump'):
+            j = tokenCorpus.build(corpusPath, dumpThreads(batchOptions['dump'],
+                                                          job.n, 
+                                                          job.subreddit))
+    elif batchOptions.get('dump'):
+        with profileStage('dump'):
+            j = postStore.fromRecords(dumpThreads(batchOptions['dump'], 
+                                                  job.n, job.subreddit))
+    else:
+        cache = None
+        if batchOptions.get('cache'):
+            cache = threadCache(batchOptions['cache'], 
+                                batchOptions.get('cache_ttl', 3600),
+                                batchOptions.get('cache_size', 256*2**20))
+        journal = None
+        if batchOptions.get('journal'):
+            journal = os.path.join(job.directory, 'journal.jsonl')
+        try:
+            with profileStage('fetch'):
+                j = threads(job.n, batchOptions.get('workers', 1), 
+                            rate=batchOptions.get('rate'), journal=journal,
+                            newer=batchOptions.get('newer', False), 
+                            cache=cache, subreddit=job.subreddit)
+        finally:
+            if cache is not None:
+                countCache(cache)
+                cache.close()
+        if corpusPath:
+            with profileStage('writeCorpus'):
+                j = tokenCorpus.build(corpusPath, j)
+    snapshot = None
+    if batchOptions.get('snapshot'):
+        snapshot = analysisSnapshot(os.path.join(job.directory, 
+                                                 'snapshot.db'))
+    #near-duplicate posts are dropped or weighted before the analysis; 
+    #with a snapshot, also the new posts of groups it has already counted
+    dups = weights = None
+    if batchOptions.get('dedup'):
+        with profileStage('nearDuplicates'):
+            dups = nearDuplicates(j, batchOptions.get('dedup_threshold', 0.8),
+                                  minWords=batchOptions.get('dedup_min_words',
+                                                            10))
+        if batchOptions['dedup'] == 'drop':
+            counted = snapshot.counted(j.ids) if snapshot is not None \
+                      else None
+            j = j.select(dups.keep(counted))
+        else:
+            weights = dups.weights()
+    if snapshot is not None:
+        with profileStage('snapshot'):
+            added = snapshot.update(j, job.treatments)
+    with open(os.path.join(job.directory, 'report.txt'), 'w', 
+              encoding='utf-8') as out:
+        if dups is not None:
+            print("%d near-duplicate posts & comments found" % 
+                  len(dups.duplicates()), file=out)
+        if snapshot is not None:
+            print("%d new posts & comments added to the snapshot" % added,
+                  file=out)
+            data = snapshot.report(job.treatments, job.subreddit, out, 
+                                   job.directory)
+        else:
+            data = communityReport(j, job.treatments, job.subreddit, out, 
+                                   job.directory, weights)
+        if batchOptions.get('thread_metrics'):
+            threadReport(j, os.path.join(job.directory, 'threads.csv'), out)
+        if batchOptions.get('co_mentions'):
+            coMentionReport(j, job.treatments, data.variations,
+                            os.path.join(job.directory, 'co_mentions.csv'), 
+                            out)
+    profiles = None
+    if batchOptions.get('profiles') or batchOptions.get('export'):
+        #jobs already run in parallel, so each job profiles its authors in
+        #its own process
+        with profileStage('profileAuthors'):
+            if snapshot is not None:
+                profiles = snapshot.profiles(job.treatments)
+            else:
+                profiles = profileAuthors(j, job.treatments, rxPath=rxPath)
+    if batchOptions.get('profiles'):
+        writeProfiles(profiles, os.path.join(job.directory, 'authors.csv'))
+    if batchOptions.get('export'):
+        exportReport(data, job.directory, batchOptions['export'], profiles)
+    if snapshot is not None:
+        snapshot.close()
+    if runProfile is not None:
+        runProfile.write(os.path.join(job.directory, 'profile.json'))
+        runProfile = None
+    return len(j)
+
+def batchReports(jobs, processes=None, **options):
+    """
+    Writes the reports of a list of reportJobs, running them in a pool of
+    worker processes (by default one per job, up to the number of CPUs).
+    Options are: settings (Reddit API credentials for redditClient) or 
+    dump (a list of dump files to read instead), tokenizer, lexicon (a
+    frozen lexicon file, built here first if needed so that the workers 
+    can share it), workers (threads per process fetching comments), 
+    journal and newer (to keep a journal of fetched threads in 
+    journal.jsonl, see threads), cache, cache_ttl and cache_size (see 
+    threadCache), rx_index (to keep each community's treatment index in 
+    rx_index.json), write_corpus (to analyze the posts from a token corpus 
+    written to corpus/, see tokenCorpus), snapshot (to keep the totals of
+    the community in snapshot.db and report from them, see 
+    analysisSnapshot), thread_metrics (to also write the metrics of each 
+    thread to threads.csv, see threadReport), co_mentions (to also write 
+    the treatments mentioned together to co_mentions.csv, see 
+    coMentionReport), dedup, dedup_threshold and dedup_min_words (to drop
+    or weight near-duplicate posts, see nearDuplicates), profiles (to also write the profiles of all authors 
+    to authors.csv), export (a format to also export each section of the
+    report in, see exportReport) and profile (a dictionary of profilerOf 
+    options, to write profile.json); files are written to each job's 
+    directory. Reddit's API rate limit is split evenly between the 
+    processes. Returns a dictionary of the number
+    of posts analyzed for each subreddit, or the error its job failed with.
+    A token corpus keeps only words, so write_corpus can't be combined 
+    with snapshot, thread_metrics or dedup='drop' (ValueError).
+    """
+    if options.get('write_corpus'):
+        for option in ('snapshot', 'thread_metrics'):
+            if options.get(option):
+                raise ValueError("%s can't be used with write_corpus: a "
+                                 "token corpus keeps only words" % option)
+        if options.get('dedup') == 'drop':
+            raise ValueError("posts can't be dropped from a token corpus, "
+                             "so write_corpus needs dedup='weight'")
+    processes = processes or min(len(jobs), os.cpu_count() or 1)
+    options.setdefault('rate', redditRate/processes)
+    if options.get('lexicon'):
+        loadLexicon(options['lexicon'])
+    results = {}
+    with ProcessPoolExecutor(processes) as pool:
+        futures = [(job, pool.submit(runJob, job, options)) for job in jobs]
+        for job, future in futures:
+            try:
+                results[job.subreddit] = future.result()
+                print("Report for %s (%d posts & comments): %s" % 
+                      (job.subreddit, results[job.subreddit], job.directory))
+            except Exception as e:
+                print("Report for %s failed:" % job.subreddit, e)
+                results[job.subreddit] = e
+    return results
+
 ###########################
 
 #Here begins the part of the code that produces the analysis that is
-#printed out in the console. It first asks the user to choose one of four
-#disease states to analyze:
+#printed out in the console. Posts are either fetched live from Reddit, 
+#which needs the API credentials as arguments:
+#   python Reddit_conversation_analysis.py <client_id> <secret> <user_agent>
+#or read offline from one or more archived dump files:
+#   python Reddit_conversation_analysis.py --dump RS_ms.zst RC_ms.zst
+
+def parseArgs(argv=None):
+    """
+    Reads the command-line arguments: Reddit API credentials for live
+    fetching, or --dump followed by dump files for offline analysis
+    """
+    parser = argparse.ArgumentParser(description="""Analyzes recent 
+    conversations in a health-related Reddit community""")
+    parser.add_argument('cid', nargs='?', help='Reddit API client id')
+    parser.add_argument('secret', nargs='?', help='Reddit API client secret')
+    parser.add_argument('agent', nargs='?', help='Reddit API user agent')
+    parser.add_argument('--workers', type=int, default=1,
+                        help="""number of threads whose comments are 
+                        fetched from Reddit in parallel (default 1)""")
+    parser.add_argument('--journal', metavar='FILE',
+                        help="""record fetched threads in this file, and 
+                        resume from it if a previous run was interrupted 
+                        (in batch mode, any value keeps journal.jsonl in 
+                        each report directory)""")
+    parser.add_argument('--newer', action='store_true',
+                        help="""only fetch threads newer than the newest 
+                        one in the journal""")
+    parser.add_argument('--cache', metavar='FILE',
+                        help="""keep fetched threads in this SQLite 
+                        database and reuse them on later runs""")
+    parser.add_argument('--cache-ttl', type=float, default=3600,
+                        help="""seconds before a cached thread is fetched 
+                        again (default 3600)""")
+    parser.add_argument('--cache-size', type=float, default=256,
+                        help='maximum size of the cache in MB (default 256)')
+    parser.add_argument('--tokenizer', choices=['nltk', 'fast'], 
+                        default='nltk', help="""split text into words with 
+                        NLTK (default) or the faster single-pass tokenizer""")
+    parser.add_argument('--rx-index', metavar='FILE',
+                        help="""load the treatment misspelling index from 
+                        this file (it's built and saved there the first 
+                        time; in batch mode, any value keeps rx_index.json
+                        in each report directory)""")
+    parser.add_argument('--lexicon', metavar='FILE',
+                        help="""load the English word list and stopwords 
+                        from this file (it's built from NLTK and saved there
+                        the first time)""")
+    parser.add_argument('--batch', nargs='*', metavar='JOB',
+                        help="""analyze these communities without asking 
+                        anything, in parallel processes, and write their 
+                        reports to files: community names, or 
+                        SUBREDDIT:COMMUNITY to use a community's treatment
+                        dictionary for another subreddit (default: all 
+                        four)""")
+    parser.add_argument('--threads', type=int, default=20,
+                        help="""number of threads per community in batch 
+                        mode (default 20)""")
+    parser.add_argument('--processes', type=int,
+                        help="""number of processes in batch mode (default:
+                        one per community, up to the number of CPUs) or for
+                        --profiles (default: the number of CPUs)""")
+    parser.add_argument('--profiles', metavar='FILE',
+                        help="""also profile every author, not just the top
+                        20, in --processes worker processes, and write the 
+                        profiles to this CSV file (in batch mode, any value
+                        writes authors.csv in each report directory)""")
+    parser.add_argument('--thread-metrics', metavar='FILE',
+                        help="""also measure the reply structure of each 
+                        thread (reply depth, branching, time to the first 
+                        reply) and write it to this CSV file (in batch 
+                        mode, any value writes threads.csv in each report 
+                        directory)""")
+    parser.add_argument('--co-mentions', metavar='FILE',
+                        help="""also count which treatments are mentioned
+                        together (in posts and by authors) and the likely 
+                        switches from one to another, and write them to this
+                        CSV file (in batch mode, any value writes 
+                        co_mentions.csv in each report directory)""")
+    parser.add_argument('--profile', metavar='FILE',
+                        help="""write the time, CPU time and memory of each 
+                        stage of the run, and counters of API calls, rows, 
+                        tokens, misspelling variants and cache hits, to 
+                        this JSON file (in batch mode, any value writes 
+                        profile.json in each report directory)""")
+    parser.add_argument('--profile-memory', action='store_true',
+                        help="""also trace the memory allocated by each 
+                        stage (slows the run down)""")
+    parser.add_argument('--profile-stage', metavar='STAGE',
+                        help="""run this stage (e.g. redditRx, fetch) under
+                        --profile-hook, writing its results next to the
+                        profile""")
+    parser.add_argument('--profile-hook', choices=['cprofile', 'tracemalloc'],
+                        default='cprofile')
+    parser.add_argument('--export', metavar='DIR',
+                        help="""write each section of the report, and the 
+                        profiles of all authors, to its own file in this 
+                        directory (in --export-format) and the charts to 
+                        image files there, instead of printing the report 
+                        (in batch mode, any value exports to each report 
+                        directory)""")
+    parser.add_argument('--export-format', choices=exportFormats, 
+                        default='csv', help="""format of the exported 
+                        sections: csv (default), ndjson (one JSON object 
+                        per line) or parquet (needs pyarrow)""")
+    parser.add_argument('--out', default='reports', metavar='DIR',
+                        help="""directory for the batch reports (default 
+                        reports)""")
+    parser.add_argument('--dump', nargs='+', metavar='FILE',
+                        help="""read posts from local JSONL dump files 
+                        (optionally .gz, .bz2, .xz or .zst compressed) 
+                        instead of fetching them from Reddit""")
+    parser.add_argument('--dedup', choices=['drop', 'weight'],
+                        help="""find near-duplicate posts (cross-posts, 
+                        copied messages, bot comments) and drop all but the
+                        earliest of each group, or weight each group as one 
+                        post in the treatment, keyword and author counts""")
+    parser.add_argument('--dedup-threshold', type=float, default=0.8,
+                        help="""how similar (Jaccard similarity of their 
+                        3-word sequences) posts must be to be near-duplicates
+                        (default 0.8)""")
+    parser.add_argument('--dedup-min-words', type=int, default=10,
+                        help="""posts with fewer words are never 
+                        near-duplicates (default 10)""")
+    parser.add_argument('--snapshot', metavar='FILE',
+                        help="""keep the totals of the analysis in this 
+                        SQLite database: only posts that aren't in it yet are 
+                        analyzed, and the report is printed from the 
+                        updated totals (posts are recognized by their ids,
+                        which a token corpus doesn't keep; in batch mode, 
+                        any value keeps snapshot.db in each report 
+                        directory)""")
+    parser.add_argument('--write-corpus', metavar='DIR',
+                        help="""tokenize the posts into a token corpus in 
+                        this directory, and analyze them from it (posts 
+                        from --dump are streamed to it, so archives larger
+                        than memory can be analyzed; in batch mode, any 
+                        value writes corpus/ in each report directory)""")
+    parser.add_argument('--corpus', metavar='DIR',
+                        help="""analyze the token corpus written to this 
+                        directory by --write-corpus, memory-mapped, instead
+                        of fetching or reading posts""")
+    args = parser.parse_args(argv)
+    if not (args.dump or args.corpus) and \
+       not (args.cid and args.secret and args.agent):
+        parser.error('either Reddit API credentials, --dump or --corpus '
+                     'are required')
+    if args.batch is not None and args.corpus:
+        parser.error('a token corpus holds the posts of one community, so '
+                     '--corpus can\'t be used with --batch')
+    if args.snapshot and (args.corpus or args.write_corpus):
+        parser.error('a token corpus keeps no post ids, so it can\'t tell '
+                     'which posts a --snapshot has already counted')
+    if args.thread_metrics and (args.corpus or args.write_corpus):
+        parser.error('a token corpus has no reply structure for '
+                     '--thread-metrics')
+    if args.dedup == 'drop' and (args.corpus or args.write_corpus):
+        parser.error('posts can only be dropped from a token corpus with '
+                     '--dedup weight')
+    if args.dedup == 'weight' and args.snapshot:
+        parser.error('a snapshot can only be updated with --dedup drop')
+    return args
 
-diseaseState = input("""Welcome! 
+if __name__ == '__main__':
+    args = parseArgs()
+    tokenizerEngine = args.tokenizer
+    lexiconPath = args.lexicon
+    if args.export:
+        offscreenCharts()
+    if args.profile and args.batch is None:
+        runProfile = profilerOf(args.profile, args.profile_memory,
+                                args.profile_stage, args.profile_hook)
+    if args.batch is not None:
+        settings = None
+        if not args.dump:
+            settings = dict(client_id=args.cid, client_secret=args.secret,
+                            user_agent=args.agent)
+        try:
+            jobs = parseJobs(args.batch, args.threads, args.out)
+        except ValueError as e:
+            sys.exit(e)
+        results = batchReports(jobs, args.processes, settings=settings,
+                               dump=args.dump, tokenizer=args.tokenizer,
+                               lexicon=args.lexicon, workers=args.workers,
+                               journal=bool(args.journal), newer=args.newer,
+                               cache=args.cache, cache_ttl=args.cache_ttl,
+                               rx_index=bool(args.rx_index),
+                               write_corpus=bool(args.write_corpus),
+                               snapshot=bool(args.snapshot),
+                               thread_metrics=bool(args.thread_metrics),
+                               co_mentions=bool(args.co_mentions),
+                               dedup=args.dedup, 
+                               dedup_threshold=args.dedup_threshold,
+                               dedup_min_words=args.dedup_min_words,
+                               cache_size=int(args.cache_size*2**20),
+                               profiles=bool(args.profiles),
+                               export=args.export and args.export_format,
+                               profile=args.profile and 
+                                       dict(memory=args.profile_memory,
+                                            stage=args.profile_stage,
+                                            hook=args.profile_hook))
+        sys.exit(any(isinstance(r, Exception) for r in results.values()))
+
+    #It first asks the user to choose one of four disease states to analyze:
+    diseaseState = input("""Welcome! 
 This program will analyze recent Reddit
 conversations in a community (subreddit) 
 for one of the medical conditions below.
@@ -594,132 +4147,147 @@ Choose disease state to analyze:
 4 - Crohn's Disease
 >> """)
     
-try:
-    if int(diseaseState) == 1:
-        subreddit = reddit.subreddit('MultipleSclerosis')
-        treatmentDict = MSTreatmentDict
-    elif int(diseaseState) == 2:
-        subreddit = reddit.subreddit('Diabetes')
-        treatmentDict = DiaTreatmentDict
-    elif int(diseaseState) == 3:
-        subreddit = reddit.subreddit('Psoriasis')
-        treatmentDict = PsTreatmentDict
-    elif int(diseaseState) == 4:
-        subreddit = reddit.subreddit('CrohnsDisease')
-        treatmentDict = CDtreatmentDict
-except:
-    subreddit = reddit.subreddit('MultipleSclerosis')
-    treatmentDict = MSTreatmentDict
-    print("""Your response wasn't recognized. 'Multiple Sclerosis' will
+    try:
+        if not 1 <= int(diseaseState) <= len(communities):
+            raise ValueError(diseaseState)
+        subredditName, treatmentDict = communities[int(diseaseState)-1]
+    except:
+        subredditName, treatmentDict = communities[0]
+        print("""Your response wasn't recognized. 'Multiple Sclerosis' will
     be analyzed""")
+    if not (args.dump or args.corpus):
+        redditSettings = dict(client_id=args.cid,
+                              client_secret=args.secret,
+                              user_agent=args.agent)
+        reddit = redditClient(**redditSettings)
+    treatmentIndex(treatmentDict, args.rx_index)
 
-#Next asks user for number of Reddit threads to analyze, with a limit
-#of 20. In reality, users would probably be most interested in analyzing
-#posts for specific time period, but for now this is based on number of posts
-n = input("""How many threads would you like to import? (Limit of 20) 
+    #Next asks user for number of Reddit threads to analyze, with a limit
+    #of 20 when fetching from Reddit. In reality, users would probably be 
+    #most interested in analyzing posts for specific time period, but for 
+    #now this is based on number of posts
+    if args.corpus:
+        n = None
+    elif args.dump:
+        n = input("""How many threads would you like to analyze? 
+(Leave empty for all threads in the dump) 
+>>  """)
+        try:
+            n = int(n)
+        except:
+            n = None
+    else:
+        n = input("""How many threads would you like to import? (Limit of 20) 
 >>  """)
+    
+        try:
+            n = int(n)
+            if n > 20: 
+                n = 20
+                print("""The maximum number of threads (20) will be analyzed""")
+        except: 
+            n = 20
+            print("""The maximum number of threads (20) will be analyzed""")
 
-try:
-    n = int(n)
-    if n > 20: 
-        n = 20
-        print("""The maximum number of threads (20) will be analyzed""")
-except: 
-    n = 20
-    print("""The maximum number of threads (20) will be analyzed""")
-
-#call functions to get necessary lists and dictionaries for output
-j = threads(n)
-jtxt = redditText(j)
-jwords = set(jtxt)
-jwordsunc = uncommonWords(jwords)
-jrx = redditRx(jwordsunc)
-jauthors = authorCount(j)
-
-#Analysis printed out below
-
-print("")
-print("""Table of Contents\n1. Number of posts & comments\n2. Dates of posts
-3. Treatment Counts\n4. Treatment variations and misspellings
-5. Top 20 keywords\n6. Top Authors""")
-
-print("")
-print("- 1 - ")
-print("")
-thrdCount = [int(i[0]) for i in j]
-maxx = max(thrdCount)
-print("Total threads analyzed: %d" % maxx)
-num = len(j)
-print("Number of Reddit posts & comments analyzed: %d" % num)
-
-#prints plot of dates
-print("")
-print("- 2 -")
-datesPlot(j)
-
-#prints list of treatments mentioned, accounting for common misspellings
-print("")
-print("- 3 -")
-treatmentCount(jtxt, jrx)
-
-print("")
-print("- 4 -")
-print("")
-print("TREATMENT VARIATIONS (& MISSPELLINGS):")
-for k,v in jrx.items():
-    print(k, end=": ")
-    for rx in v:
-        print(rx, end = " ")
-    print("")
-
-#Top 20 keywords for the whole reddit corpus
-print("")
-print("- 5 -")
-print("")
-jkeyw = keywords(jtxt)
-print("TOP 20 KEYWORDS       WORD COUNT")
-for pos, kv in enumerate(jkeyw):
-    try:
-        spaces = (20 - len(kv[0]))*' '
-    except:
-        spaces = '  '
-    print(str(pos+1)+'.',kv[0],spaces,kv[1])
-
-#Here is a basic table showing the top 20 authors with information about them, 
-#including number of posts, age, gender, date of diagnosis, and top keyword 
-#they use (plus count of that keyword)
-print("")
-print("- 6 -")
-print("")
-print("TOP 20 AUTHORS")
-print("")
-tab = tt.Texttable()
-headings = ['Author','Posts','Age','Gender','Dx Date','Current Rx','Top Keyword [count]']
-tab.header(headings)
-authors = topAuthors(jauthors)
-posts = []
-age = []
-gender = []
-dx = []
-rx = []
-kws = []
-for author in authors:
-    author = redditor(author)
-    author.getInfo(j)
-    author.getText(j)
-    posts.append(author.getPosts(j))
-    a,d = author.getAgeDx()
-    age.append(a)
-    dx.append(d)
-    gender.append(author.getGender())
-    rx.append(author.getRx())
-    kw = author.getKeywords()
-    kw = kw[0]
-    kw = kw[0]+" ["+str(kw[1])+"]"
-    kws.append(kw)
-
-for row in zip(authors,posts,age,gender,dx,rx,kws):
-    tab.add_row(row)
-
-author_table = tab.draw()
-print (author_table)
+    #get the posts and comments to analyze
+    if args.corpus:
+        with profileStage('corpus'):
+            j = tokenCorpus.open(args.corpus)
+    elif args.dump and args.write_corpus:
+        #the stream from the dump is tokenized straight to the corpus
+        with profileStage('dump'):
+            j = tokenCorpus.build(args.write_corpus, 
+                                  dumpThreads(args.dump, n, subredditName))
+    elif args.dump:
+        #The sections below read the posts several times, so the stream
+        #from the dump is collected into a (compact) postStore first
+        with profileStage('dump'):
+            j = postStore.fromRecords(dumpThreads(args.dump, n, 
+                                                  subredditName))
+    else:
+        cache = None
+        if args.cache:
+            cache = threadCache(args.cache, args.cache_ttl, 
+                                int(args.cache_size*2**20))
+        with profileStage('fetch'):
+            j = threads(n, args.workers, journal=args.journal, 
+                        newer=args.newer, cache=cache, 
+                        subreddit=subredditName)
+        if cache is not None:
+            countCache(cache)
+            stats = cache.stats()
+            print("Thread cache: %d hits, %d misses (%d stale), "
+                  "%d API requests saved" % (stats['hits'], stats['misses'],
+                                             stats['stale'],
+                                             stats['requests_saved']))
+            cache.close()
+        if args.write_corpus:
+            with profileStage('writeCorpus'):
+                j = tokenCorpus.build(args.write_corpus, j)
+
+    snapshot = None
+    if args.snapshot:
+        snapshot = analysisSnapshot(args.snapshot)
+
+    #near-duplicate posts are dropped or weighted before the analysis; 
+    #with a snapshot, also the new posts of groups it has already counted
+    weights = None
+    if args.dedup:
+        with profileStage('nearDuplicates'):
+            dups = nearDuplicates(j, args.dedup_threshold, 
+                                  minWords=args.dedup_min_words)
+        print("%d near-duplicate posts & comments found" % 
+              len(dups.duplicates()))
+        if args.dedup == 'drop':
+            counted = snapshot.counted(j.ids) if snapshot is not None \
+                      else None
+            j = j.select(dups.keep(counted))
+        else:
+            weights = dups.weights()
+
+    #Analysis printed out below, or exported
+    if args.snapshot:
+        with profileStage('snapshot'):
+            added = snapshot.update(j, treatmentDict)
+        print("%d new posts & comments added to %s" % (added, args.snapshot))
+        if args.export:
+            data = snapshot.data(treatmentDict, subredditName)
+        else:
+            data = snapshot.report(treatmentDict, subredditName)
+    elif args.export:
+        data = communityData(j, treatmentDict, subredditName, weights)
+    else:
+        data = communityReport(j, treatmentDict, subredditName, 
+                               weights=weights)
+
+    profiles = None
+    if args.profiles or args.export:
+        with profileStage('profileAuthors'):
+            if args.snapshot:
+                profiles = snapshot.profiles(treatmentDict)
+            else:
+                profiles = profileAuthors(j, treatmentDict, 
+                                          processes=args.processes or 
+                                                    os.cpu_count(),
+                                          rxPath=args.rx_index)
+    if args.profiles:
+        writeProfiles(profiles, args.profiles)
+        print("")
+        print("Profiles of %d authors written to %s" % (len(profiles), 
+                                                        args.profiles))
+    if args.export:
+        paths = exportReport(data, args.export, args.export_format, profiles)
+        print("")
+        print("Report exported to %d files in %s" % (len(paths), 
+                                                     args.export))
+
+    if args.thread_metrics:
+        threadReport(j, args.thread_metrics)
+
+    if args.co_mentions:
+        coMentionReport(j, treatmentDict, data.variations, args.co_mentions)
+
+    if runProfile is not None:
+        runProfile.write(args.profile)
+        print("")
+        print("Profile of the run written to %s" % args.profile)
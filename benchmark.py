@@ -0,0 +1,818 @@
+"""
+Benchmarks for the Reddit conversation analysis script. They run without
+Reddit credentials or network access: posts are fetched from a fake Reddit
+API server started locally, which serves a deterministic made-up community
+with the same JSON format (and some artificial latency) as the real API.
+
+    python benchmark.py fetch --workers 1 2 4 8
+    python benchmark.py tokenizer [--dump FILE ...]
+    python benchmark.py rx --words 200000
+    python benchmark.py startup
+    python benchmark.py profiles --authors 20000 --processes 1 2 4 8
+    python benchmark.py pipeline --rows 1000 100000 [10000000]
+"""
+
+import argparse
+import json
+import os
+import random
+import socketserver
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import Reddit_conversation_analysis as rca
+
+#Words used to make up the text of fake posts and comments, including a
+#few treatment names and misspellings from the MS treatment dictionary
+fakeVocabulary = ('i have been on tecfidera for two years and the flushing '
+                  'is better now my neuro wants me to switch to ocrevus '
+                  'because of new lesions on my mri copaxone shots were '
+                  'painful techfidera gilenya fatigue is the worst symptom '
+                  'does anyone else get numbness in their hands after a '
+                  'hot shower relapse steroids infusion tomorrow').split()
+
+fakeFlair = (None, None, None, 'F 34, dx 2015, Ocrevus', 'M, 41, Dx 2012',
+             'Tecfidera since 2016', '29F | RRMS | Gilenya')
+
+class fakeReddit(object):
+    """
+    Deterministic made-up subreddit for the fake API server: `threads`
+    submissions, each with `comments` comments arranged in reply trees.
+    Each submission page shows the first `shown` top-level comments (with
+    their replies); the rest are behind "load more comments" links of about
+    `chunk` comments each, so that replace_more has to make several
+    requests per thread, as it does for busy threads on Reddit.
+    """
+    def __init__(self, name='MultipleSclerosis', threads=20, comments=200,
+                 shown=10, chunk=20, seed=0):
+        rng = random.Random(seed)
+        self.name = name
+        self.submissions = []
+        self.comments = {} #submission id -> list of comment data
+        self.pages = {} #submission id -> (shown roots, list of more chunks)
+        start = 1530000000
+        for i in range(threads):
+            sub_id = 's%05d' % i
+            created = start - i*3600
+            self.submissions.append({
+                'id': sub_id, 'name': 't3_'+sub_id, 'subreddit': name,
+                'title': ' '.join(rng.choice(fakeVocabulary)
+                                  for w in range(6)),
+                'selftext': ' '.join(rng.choice(fakeVocabulary)
+                                     for w in range(rng.randint(5, 80))),
+                'author': 'user%d' % int(rng.paretovariate(1.2)),
+                'author_flair_text': rng.choice(fakeFlair),
+                'created_utc': created, 'num_comments': comments,
+                'permalink': '/r/%s/comments/%s/' % (name, sub_id)})
+            thread = []
+            for k in range(comments):
+                comment_id = '%sc%04d' % (sub_id[1:], k)
+                if k == 0 or rng.random() < 0.4:
+                    parent = 't3_'+sub_id
+                else:
+                    parent = 't1_'+thread[rng.randrange(k)]['id']
+                thread.append({
+                    'id': comment_id, 'name': 't1_'+comment_id,
+                    'parent_id': parent, 'link_id': 't3_'+sub_id,
+                    'subreddit': name,
+                    'body': ' '.join(rng.choice(fakeVocabulary)
+                                     for w in range(rng.randint(3, 60))),
+                    'author': 'user%d' % int(rng.paretovariate(1.2)),
+                    'author_flair_text': rng.choice(fakeFlair),
+                    'created_utc': created + 60*(k+1), 'score': 1})
+            self.comments[sub_id] = thread
+            #comments are grouped into whole reply trees, so every comment
+            #returned by "load more comments" arrives with its parent
+            trees = []
+            treeOf = {}
+            for comment in thread:
+                if comment['parent_id'].startswith('t3_'):
+                    trees.append([])
+                    treeOf[comment['id']] = trees[-1]
+                else:
+                    treeOf[comment['id']] = treeOf[comment['parent_id'][3:]]
+                treeOf[comment['id']].append(comment['id'])
+            chunks = []
+            for tree in trees[shown:]:
+                if not chunks or len(chunks[-1]) >= chunk:
+                    chunks.append([])
+                chunks[-1].extend(tree)
+            self.pages[sub_id] = ([t[0] for t in trees[:shown]], chunks)
+
+    def listing(self, children):
+        return {'kind': 'Listing', 'data': {'after': None, 'before': None,
+                                            'children': children}}
+
+    def thing(self, comment, tree=None):
+        """
+        Comment as served by the API; with tree, includes its replies
+        """
+        data = dict(comment, replies='')
+        if tree is not None:
+            replies = [self.thing(c, tree) for c in tree
+                       if c['parent_id'] == comment['name']]
+            if replies:
+                data['replies'] = self.listing(replies)
+        return {'kind': 't1', 'data': data}
+
+    def new(self, limit, before=None):
+        """
+        Newest submissions first; with before (a fullname), only those
+        newer than that submission
+        """
+        submissions = self.submissions
+        if before:
+            newer = [s['name'] for s in submissions].index(before)
+            submissions = submissions[:newer]
+        return self.listing([{'kind': 't3', 'data': s}
+                             for s in submissions[:limit]])
+
+    def submissionPage(self, sub_id):
+        submission = next(s for s in self.submissions if s['id'] == sub_id)
+        thread = self.comments[sub_id]
+        roots, chunks = self.pages[sub_id]
+        byId = dict((c['id'], c) for c in thread)
+        children = [self.thing(byId[r], thread) for r in roots]
+        for pos, chunk in enumerate(chunks):
+            children.append({'kind': 'more', 'data': {
+                'count': len(chunk), 'name': 't1_more%d' % pos,
+                'id': 'more%d' % pos, 'parent_id': 't3_'+sub_id,
+                'depth': 0, 'children': chunk}})
+        return [self.listing([{'kind': 't3', 'data': submission}]),
+                self.listing(children)]
+
+    def moreChildren(self, link_id, children):
+        byId = dict((c['id'], c) for c in self.comments[link_id[3:]])
+        return {'json': {'errors': [], 'data': {
+            'things': [self.thing(byId[c]) for c in children]}}}
+
+class fakeRedditHandler(BaseHTTPRequestHandler):
+    """
+    Answers the few Reddit API endpoints that PRAW uses to fetch threads
+    """
+    def reply(self, data):
+        body = json.dumps(data).encode('utf-8')
+        time.sleep(self.server.latency)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json; charset=UTF-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        with self.server.lock:
+            self.server.requests +=1
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        path = url.path.strip('/').split('/')
+        params = parse_qs(url.query)
+        if path[0] == 'r' and path[2] == 'new':
+            self.reply(self.server.reddit.new(int(params.get('limit',
+                                                             [25])[0]),
+                                              params.get('before', [None])[0]))
+        elif path[0] == 'comments':
+            self.reply(self.server.reddit.submissionPage(path[1]))
+        else:
+            self.send_error(404)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        form = parse_qs(self.rfile.read(length).decode('utf-8'))
+        path = urlparse(self.path).path.strip('/')
+        if path == 'api/v1/access_token':
+            self.reply({'access_token': 'fake', 'token_type': 'bearer',
+                        'expires_in': 86400, 'scope': '*'})
+        elif path == 'api/morechildren':
+            self.reply(self.server.reddit.moreChildren(
+                form['link_id'][0], form['children'][0].split(',')))
+        else:
+            self.send_error(404)
+
+    def log_message(self, *args):
+        pass
+
+class ThreadingHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    """
+    HTTP server that answers each request in its own thread, as 
+    http.server's own ThreadingHTTPServer (only there from Python 3.7)
+    """
+    daemon_threads = True
+
+def fakeRedditServer(reddit, latency=0.05):
+    """
+    Starts a fake Reddit API server for the fakeReddit data in a background
+    thread, answering each request after `latency` seconds. Returns the
+    server; its url attribute is what PRAW should use as oauth_url and
+    reddit_url, and its requests attribute counts the requests served.
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', 0), fakeRedditHandler)
+    server.reddit = reddit
+    server.latency = latency
+    server.lock = threading.Lock()
+    server.requests = 0
+    server.url = 'http://127.0.0.1:%d' % server.server_address[1]
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def fakeSettings(server):
+    """
+    praw.Reddit settings for a client that talks to the fake server
+    """
+    return dict(client_id='benchmark', client_secret='benchmark',
+                user_agent='Reddit_conversation_analysis benchmark',
+                oauth_url=server.url, reddit_url=server.url,
+                check_for_updates=False)
+
+def useFakeReddit(server):
+    """
+    Points the analysis module at the fake server, as its __main__ block
+    does for the real Reddit
+    """
+    rca.redditSettings = fakeSettings(server)
+    rca.reddit = rca.redditClient(**rca.redditSettings)
+
+def benchFetch(workers=(1, 2, 4, 8), threads=20, comments=200, latency=0.05,
+               rate=None):
+    """
+    Times threads() fetching from the fake server serially and with each
+    number of parallel workers, and checks that every mode returns exactly
+    the same posts in the same order. Returns a list of result dicts.
+    """
+    server = fakeRedditServer(fakeReddit(threads=threads, comments=comments),
+                              latency)
+    useFakeReddit(server)
+    results = []
+    expected = None
+    for w in workers:
+        server.requests = 0
+        start = time.perf_counter()
+        store = rca.threads(threads, workers=w, rate=rate or 1000,
+                            subreddit=server.reddit.name)
+        seconds = time.perf_counter() - start
+        rows = [(p.thread, p.comment, p.id, p.author, p.text) for p in store]
+        if expected is None:
+            expected = rows
+        results.append({'workers': w, 'seconds': round(seconds, 3),
+                        'requests': server.requests, 'posts': len(store),
+                        'posts_per_second': round(len(store)/seconds, 1),
+                        'speedup': round(results[0]['seconds']/seconds, 2)
+                                   if results else 1.0,
+                        'same_output': rows == expected})
+    server.shutdown()
+    return results
+
+#Text with the punctuation, contractions and numbers that are hardest to
+#tokenize the same way as NLTK, mixed into the tokenizer sample corpus
+trickyText = (
+    "I don't know, can't you see? I'm gonna try Tecfidera/Gilenya -- it's "
+    "10:30 a.m. e.g. U.S. cannot wanna go.",
+    'Good muffins cost $3.88 (roughly 3,36 euros)\nin New York.  Please buy '
+    'me\ntwo of them.\nThanks.',
+    'email me @ home {x} a,b a:b 1,000 "quoted" \u201csmart\u201d don\u2019t '
+    're-do ...hello a...b **bold** x^2 c++',
+    "gimme lemme gotta 1st 2nd 20 co-pay 'tis d'ye more'n rock'n'roll "
+    "haven't! won't) don't/x",
+    '\u2018single\u2019 \u00abguill\u00bb a\u2014b 50% #tag AT&T $5 :) '
+    '^_^ <3 ... .. 3.5. v1.2.3 e.g., i.e.: [link](http://x.org/a-b?c=d)')
+
+def tokenizerSample(paths=None, posts=5000):
+    """
+    Texts for the tokenizer benchmark: posts from dump files if given, 
+    otherwise made-up posts from the fake subreddit mixed with trickyText
+    """
+    if paths:
+        texts = []
+        for post in rca.dumpThreads(paths):
+            texts.append(post.text)
+            if len(texts) >= posts:
+                break
+        return texts
+    reddit = fakeReddit(threads=max(1, posts//100), comments=99)
+    texts = [s['selftext'] for s in reddit.submissions]
+    for thread in reddit.comments.values():
+        texts.extend(c['body'] for c in thread)
+    return [t + ' ' + trickyText[i % len(trickyText)]
+            for i, t in enumerate(texts)]
+
+def benchTokenizer(texts, repeat=3):
+    """
+    Conformance and throughput of the two wordsClean engines: checks for
+    every text that the fast tokenizer gives the same words as the NLTK
+    path, and times both in words per second (best of `repeat` runs).
+    Mismatching texts are returned with the results for inspection.
+    """
+    results = []
+    words = {}
+    for engine in ('nltk', 'fast'):
+        best = None
+        for r in range(repeat):
+            start = time.perf_counter()
+            out = [rca.wordsClean(t, engine) for t in texts]
+            seconds = time.perf_counter() - start
+            best = seconds if best is None else min(best, seconds)
+        words[engine] = out
+        count = sum(len(w) for w in out)
+        results.append({'engine': engine, 'texts': len(texts), 
+                        'words': count, 'seconds': round(best, 3),
+                        'words_per_second': int(count/best)})
+    mismatches = [(t, a, b) for t, a, b in zip(texts, words['nltk'],
+                                                words['fast']) if a != b]
+    matching = sum(1 for a, b in zip(words['nltk'], words['fast']) 
+                   for x, y in zip(a, b) if x == y)
+    for result in results:
+        result['identical_texts'] = len(texts) - len(mismatches)
+        result['speedup'] = round(results[0]['seconds']/result['seconds'], 2)
+    results[1]['matching_words'] = matching
+    return results, mismatches
+
+def scanRedditRx(words, treatments):
+    """
+    redditRx as it was before the rxIndex: builds the vowel-stripped and
+    one-letter-deletion variants of every word and of the treatment
+    dictionary on each call. Kept here as the reference that the indexed
+    redditRx must agree with.
+    """
+    import nltk
+    barewords = []
+    RxListNoVowels = []
+    vowels = ['a','e','i','o','u']
+    words = list(set(words))
+    rxDictNew = defaultdict(list)
+    for word in words:
+        bareword = word
+        for vowel in vowels:
+            bareword = bareword.replace(vowel,"")
+        barewords.append((bareword, word))
+        for x in rca.extraConsonant(word):
+            barewords.append((x,word))
+    barewords1 = nltk.Index((''.join(sorted(w)), x) for (w, x) in barewords)
+    for k,v in treatments.items():
+        for rx in v:
+            RxNoVowels = rx
+            for vowel in vowels:
+                RxNoVowels = RxNoVowels.replace(vowel,"")
+            RxListNoVowels.append((rx, k))
+            RxListNoVowels.append((RxNoVowels, k))
+    RxListNoVowels1 = nltk.Index((''.join(sorted(w)),x) for (w,x)
+                                     in RxListNoVowels)
+    for Rx1,Rx2 in RxListNoVowels1.items():
+        for value in barewords1[Rx1]:
+            if value:
+                if value not in rxDictNew[Rx2[0]]:
+                    rxDictNew[Rx2[0]].append(value)
+    return rxDictNew
+
+def misspell(word, rng):
+    """
+    A random one-letter misspelling of a word: a letter dropped, doubled,
+    swapped with its neighbour, or a vowel replaced
+    """
+    i = rng.randrange(len(word))
+    change = rng.randrange(4)
+    if change == 0:
+        return word[:i] + word[i+1:]
+    elif change == 1:
+        return word[:i] + word[i] + word[i:]
+    elif change == 2 and i < len(word)-1:
+        return word[:i] + word[i+1] + word[i] + word[i+2:]
+    return word[:i] + rng.choice('aeiouy') + word[i+1:]
+
+def rxVocabulary(size=200000, seed=0):
+    """
+    Large made-up vocabulary for the redditRx benchmark: random words, 
+    plus every treatment name of the four dictionaries with a few 
+    misspellings of each
+    """
+    rng = random.Random(seed)
+    treatments = set()
+    for treatmentDict in (rca.MSTreatmentDict, rca.DiaTreatmentDict,
+                          rca.PsTreatmentDict, rca.CDtreatmentDict):
+        for v in treatmentDict.values():
+            treatments.update(rx.strip() for rx in v)
+    words = set()
+    for rx in treatments:
+        words.add(rx)
+        for m in range(5):
+            words.add(misspell(rx, rng))
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    while len(words) < size:
+        words.add(''.join(rng.choice(letters) 
+                          for c in range(rng.randint(3, 14))))
+    return sorted(words)
+
+def benchRx(words, repeat=3):
+    """
+    Times redditRx with a prebuilt rxIndex against the original scan on 
+    the same words, for each treatment dictionary, and checks that both
+    give identical results. Index building (and a save/load round trip)
+    is timed separately, since it happens once per dictionary.
+    """
+    results = []
+    for name, treatments in (('MS', rca.MSTreatmentDict), 
+                             ('Diabetes', rca.DiaTreatmentDict),
+                             ('Psoriasis', rca.PsTreatmentDict),
+                             ('Crohns', rca.CDtreatmentDict)):
+        start = time.perf_counter()
+        index = rca.rxIndex(treatments)
+        build = time.perf_counter() - start
+        path = os.path.join(tempfile.mkdtemp(), 'rx.json')
+        index.save(path)
+        start = time.perf_counter()
+        loaded = rca.rxIndex.load(path)
+        load = time.perf_counter() - start
+        timings = {}
+        for engine, call in (('scan', lambda: scanRedditRx(words, treatments)),
+                             ('index', lambda: rca.redditRx(words, loaded))):
+            best = None
+            for r in range(repeat):
+                start = time.perf_counter()
+                out = call()
+                seconds = time.perf_counter() - start
+                best = seconds if best is None else min(best, seconds)
+            timings[engine] = (best, out)
+        results.append({'dictionary': name, 'words': len(words),
+                        'build_ms': round(build*1000, 2),
+                        'load_ms': round(load*1000, 2),
+                        'scan_seconds': round(timings['scan'][0], 3),
+                        'index_seconds': round(timings['index'][0], 3),
+                        'speedup': round(timings['scan'][0] /
+                                         timings['index'][0], 1),
+                        'identical': timings['scan'][1] == timings['index'][1],
+                        'matches': sum(len(v) for v in
+                                       timings['index'][1].values())})
+    return results
+
+def fakeStore(authors=20000, posts=100000, words=40, seed=0):
+    """
+    Made-up postStore for the profiling benchmark: posts by a number of 
+    authors, a few of them very active (post counts follow a power law, as
+    on Reddit), with text from fakeVocabulary and flair from fakeFlair
+    """
+    rng = random.Random(seed)
+    names = ['user%d' % i for i in range(authors)]
+    weights = [1.0/(i+1) for i in range(authors)]
+    flairs = dict((name, rng.choice(fakeFlair)) for name in names)
+    store = rca.postStore()
+    writers = names + rng.choices(names, weights, k=max(0, posts-authors))
+    for row, author in enumerate(writers):
+        text = ' '.join(rng.choice(fakeVocabulary) 
+                        for w in range(rng.randint(5, 2*words)))
+        store.add(row//20+1, row%20+1, 1530000000+row*60, 'p%d' % row, 
+                  author, flairs[author], 'title %d' % (row//20), text)
+    return store
+
+def benchProfiles(processes=(1, 2, 4, 8), authors=20000, posts=100000):
+    """
+    Times profileAuthors on every author of a made-up store with each 
+    number of worker processes, and checks that the profiles are the same
+    as with a single process
+    """
+    store = fakeStore(authors, posts)
+    index = rca.authorIndex(store)
+    rca.tokenizerEngine = 'fast'
+    path = os.path.join(tempfile.mkdtemp(), 'lexicon.bin')
+    rca.frozenLexicon.build(path, *rca.loadLexicon())
+    rca.lexiconPath = path
+    results = []
+    expected = None
+    for p in processes:
+        start = time.perf_counter()
+        profiles = rca.profileAuthors(store, rca.MSTreatmentDict, 
+                                      index=index, processes=p)
+        seconds = time.perf_counter() - start
+        if expected is None:
+            expected = profiles
+        results.append({'processes': p, 'authors': len(profiles),
+                        'posts': len(store), 'seconds': round(seconds, 3),
+                        'authors_per_second': round(len(profiles)/seconds),
+                        'speedup': round(results[0]['seconds']/seconds, 2)
+                                   if results else 1.0,
+                        'same_output': profiles == expected})
+    return results
+
+#Common words of posts in the synthetic corpus
+commonWords = ('i the and to a of my it is in that for was have on with but '
+               'this you be not so just at me do are had about if like '
+               'been get they can what when out or all one an he she now '
+               'day time years doctor neuro pain tired today week started '
+               'feel better worse going think know really also still new '
+               'symptoms back after first year months because help any '
+               'anyone else experience side effects infusion shots scan mri '
+               'lesions relapse fatigue numbness insulin sugar levels skin '
+               'flare gut diet medication dose nurse appointment results '
+               'hope good bad thanks everyone same here too much little').split()
+
+flairTemplates = ('{sex} {age}, dx {year}, {rx}', '{sex}, {age}, Dx {year}',
+                  '{rx} since {year}', '{age}{sex} | RRMS | {rx}', 
+                  'Diagnosed {year} | {rx}', '{age}/{sex} - {rx}', 
+                  'T1D since {year}, {rx}', 'dx {year} | {age} | {sex}',
+                  '{rx}')
+
+def treatmentWords(rng, misspellings=3):
+    """
+    Words of every treatment name in the four treatment dictionaries, 
+    with a few misspellings of each
+    """
+    words = set()
+    for name, treatments in rca.communities:
+        for v in treatments.values():
+            for rx in v:
+                for word in rx.split():
+                    words.add(word)
+                    for m in range(misspellings):
+                        words.add(misspell(word, rng))
+    return sorted(words)
+
+def syntheticCorpus(rows, seed=0, threadSize=50, words=30):
+    """
+    Deterministic made-up corpus of `rows` posts and comments, as redditPost
+    records like those stored by threads(): threads of `threadSize` rows,
+    written by rows/10 authors (a few of them very active) with flair made
+    up from flairTemplates for about a third of them, and text mixing 
+    common words with treatment names and misspellings from the four 
+    treatment dictionaries. Each comment replies to an earlier post of its
+    thread (drawn from a separate generator, so the other fields are the 
+    same as without replies). Records are generated one at a time, so even
+    the largest corpora can be streamed.
+    """
+    rng = random.Random(seed)
+    replies = random.Random(-seed-1)
+    treatments = treatmentWords(rng)
+    authors = max(1, rows//10)
+    weights = [1.0/(i+1) for i in range(min(authors, 100000))]
+    cumulative = []
+    total = 0
+    for w in weights:
+        total += w
+        cumulative.append(total)
+    flairs = []
+    for i in range(500):
+        flairs.append(rng.choice(flairTemplates).format(
+            sex=rng.choice('MFmf'), age=rng.randint(18, 75),
+            year=rng.randint(1990, 2019), rx=rng.choice(treatments)))
+    dates = {}
+    start = 1530000000
+    for row in range(rows):
+        thread, comment = row//threadSize+1, row%threadSize+1
+        author = rng.choices(range(len(weights)), cum_weights=cumulative)[0]
+        if author >= 90000:
+            #the long tail of authors with a single post
+            author = rng.randrange(authors)
+        flair = flairs[author % len(flairs)] if author % 3 == 0 else None
+        text = rng.choices(commonWords, k=rng.randint(5, 2*words))
+        if rng.random() < 0.3:
+            text[rng.randrange(len(text))] = rng.choice(treatments)
+        created = start + row*30
+        day = created//86400
+        if day not in dates:
+            dates[day] = datetime.utcfromtimestamp(created)\
+                                 .strftime('%b %d, %Y')
+        parent = None
+        if comment > 1:
+            parent = 'x%d' % (row - comment + 1 + 
+                              replies.randrange(comment - 1))
+        yield rca.redditPost(thread, comment, dates[day], 'x%d' % row,
+                             'user%d' % author, flair, 
+                             'thread %d' % thread, ' '.join(text), created,
+                             parent)
+
+def measure(stage, call, memory=True):
+    """
+    Runs one pipeline stage, timing it, then (if memory) running it again 
+    under tracemalloc for its peak memory use. Returns its result and 
+    timings.
+    """
+    start = time.perf_counter()
+    cpu = time.process_time()
+    result = call()
+    timing = {'stage': stage, 
+              'seconds': round(time.perf_counter() - start, 4),
+              'cpu_seconds': round(time.process_time() - cpu, 4)}
+    if memory:
+        tracemalloc.start()
+        call()
+        timing['peak_mb'] = round(tracemalloc.get_traced_memory()[1]/2**20, 2)
+        tracemalloc.stop()
+    return result, timing
+
+def benchPipeline(sizes=(1000, 100000), memory=True, seed=0):
+    """
+    Times (and measures the peak memory of) each stage of the analysis 
+    separately, on synthetic corpora of each size. The MS treatment 
+    dictionary is used; the stages are run the way communityReport runs 
+    them. Returns one result dict per size and stage.
+    """
+    rca.loadLexicon()
+    treatments = rca.MSTreatmentDict
+    results = []
+    for rows in sizes:
+        def tokenize():
+            #starting with no words kept, as in a new store
+            store.tokenLists = [None]*len(store)
+            return [store.tokenIds(row) for row in range(len(store))]
+        store, timing = measure('postStore', lambda: rca.postStore.fromRecords(
+            syntheticCorpus(rows, seed)), memory)
+        stages = [timing]
+        tokens, timing = measure('wordsClean', tokenize, memory)
+        stages.append(timing)
+        #the corpus as a list of strings, as author profiles still read it
+        words, timing = measure('redditText', lambda: rca.redditText(store),
+                                memory)
+        stages.append(timing)
+        del words
+        #the corpus as vocabulary ids, as communityReport uses it
+        txt, timing = measure('corpusIds', lambda: rca.corpusIds(store),
+                              memory)
+        stages.append(timing)
+        unc, timing = measure('uncommonWords', 
+                              lambda: rca.uncommonWords(txt), memory)
+        stages.append(timing)
+        rx, timing = measure('redditRx', 
+                             lambda: rca.redditRx(unc, treatments=treatments),
+                             memory)
+        stages.append(timing)
+        counts, timing = measure('treatmentCount', 
+                                 lambda: rca.treatmentCount(txt, rx, 
+                                                            treatments),
+                                 memory)
+        stages.append(timing)
+        kws, timing = measure('keywords', lambda: rca.keywords(txt), memory)
+        stages.append(timing)
+        def authors():
+            index = rca.authorIndex(store)
+            return index, rca.topAuthors(rca.authorCount(index))
+        (index, top), timing = measure('authorCount/topAuthors', authors,
+                                       memory)
+        stages.append(timing)
+        table, timing = measure('redditor table', lambda: rca.authorTable(
+            store, index, treatments, top), memory)
+        stages.append(timing)
+        def tree():
+            tree = rca.commentTree(store)
+            return tree.metrics(), tree.topReplies()
+        metrics, timing = measure('commentTree', tree, memory)
+        stages.append(timing)
+        dups, timing = measure('nearDuplicates', 
+                               lambda: rca.nearDuplicates(store), memory)
+        stages.append(timing)
+        for timing in stages:
+            results.append(dict({'rows': rows, 'words': len(txt)}, **timing))
+    return results
+
+#What importing the script did before PRAW, NLTK and matplotlib were 
+#imported lazily and the lexicon was loaded on first use
+eagerImports = """
+import praw, prawcore, nltk
+from nltk.corpus import stopwords
+from nltk.corpus import words as wordlist
+from matplotlib import pyplot as plt
+wordList = set(word.lower() for word in wordlist.words())
+stopWords = set(stopwords.words('english'))
+"""
+
+def timeStartup(code, repeat=5):
+    """
+    Best wall time of running code in a new Python process, in the 
+    directory of the script so that it can be imported
+    """
+    here = os.path.dirname(os.path.abspath(rca.__file__))
+    best = None
+    for r in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', code], cwd=here, check=True)
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return best
+
+def benchStartup(repeat=5):
+    """
+    Times a new process importing the script, and loading the lexicon
+    (then finding the uncommon words of a sentence) from the NLTK corpora
+    and from a frozen lexicon file, against the imports and lexicon 
+    loading that importing the script used to do
+    """
+    path = os.path.join(tempfile.mkdtemp(), 'lexicon.bin')
+    rca.frozenLexicon.build(path, *rca.loadLexicon())
+    sample = ("rca.uncommonWords('my neuro switched me from tecfidera to "
+              "ocrevus last spring'.split())")
+    steps = (('python', 'pass'),
+             ('eager imports (before)', eagerImports),
+             ('import', 'import Reddit_conversation_analysis as rca'),
+             ('import + NLTK lexicon', 
+              'import Reddit_conversation_analysis as rca\n' + sample),
+             ('import + lexicon file',
+              'import Reddit_conversation_analysis as rca\n'
+              'rca.lexiconPath = %r\n' % path + sample))
+    results = []
+    for name, code in steps:
+        results.append({'step': name, 
+                        'seconds': round(timeStartup(code, repeat), 3)})
+    return results
+
+def report(name, results, output=None):
+    """
+    Prints benchmark results as a table, and writes them to a JSON file
+    if an output path is given
+    """
+    print(name)
+    if results:
+        keys = list(results[0].keys())
+        print('  '.join('%12s' % k[:12] for k in keys))
+        for row in results:
+            print('  '.join('%12s' % row[k] for k in keys))
+    if output:
+        with open(output, 'w') as out:
+            json.dump({name: results}, out, indent=2)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="""Benchmarks for the Reddit
+    conversation analysis script""")
+    commands = parser.add_subparsers(dest='command')
+    fetch = commands.add_parser('fetch', help="""serial vs parallel thread
+                                fetching from a local fake Reddit API""")
+    fetch.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    fetch.add_argument('--threads', type=int, default=20)
+    fetch.add_argument('--comments', type=int, default=200)
+    fetch.add_argument('--latency', type=float, default=0.05,
+                       help='seconds the fake server waits per request')
+    fetch.add_argument('--rate', type=float, default=None,
+                       help='requests per second allowed by the token bucket')
+    tokenizer = commands.add_parser('tokenizer', help="""conformance and 
+                                    speed of the fast tokenizer vs NLTK""")
+    tokenizer.add_argument('--dump', nargs='+', metavar='FILE',
+                           help='use posts from these dump files')
+    tokenizer.add_argument('--posts', type=int, default=5000)
+    rx = commands.add_parser('rx', help="""redditRx with the prebuilt 
+                             misspelling index vs the original scan""")
+    rx.add_argument('--words', type=int, default=200000)
+    startup = commands.add_parser('startup', help="""time to start a new 
+                                  process with the script and its lexicon""")
+    startup.add_argument('--repeat', type=int, default=5)
+    profiles = commands.add_parser('profiles', help="""profiling every author
+                                   with a number of worker processes""")
+    profiles.add_argument('--processes', type=int, nargs='+', 
+                          default=[1, 2, 4, 8])
+    profiles.add_argument('--authors', type=int, default=20000)
+    profiles.add_argument('--posts', type=int, default=100000)
+    pipeline = commands.add_parser('pipeline', help="""time and peak memory 
+                                   of each analysis stage on synthetic 
+                                   corpora""")
+    pipeline.add_argument('--rows', type=int, nargs='+', 
+                          default=[1000, 100000],
+                          help='corpus sizes (e.g. 1000 100000 10000000)')
+    pipeline.add_argument('--tokenizer', choices=['nltk', 'fast'],
+                          default='nltk')
+    pipeline.add_argument('--lexicon', metavar='FILE',
+                          help='load the lexicon from this file')
+    pipeline.add_argument('--no-memory', action='store_true',
+                          help="""skip measuring peak memory (which runs 
+                          each stage twice)""")
+    pipeline.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='also write results to this JSON file')
+    args = parser.parse_args()
+    if args.command == 'fetch':
+        results = benchFetch(args.workers, args.threads, args.comments,
+                             args.latency, args.rate)
+        report('fetch', results, args.output)
+        different = [r['workers'] for r in results if not r['same_output']]
+        if different:
+            sys.exit("Fetching with %s workers gave different posts" % 
+                     ', '.join(map(str, different)))
+    elif args.command == 'tokenizer':
+        results, mismatches = benchTokenizer(tokenizerSample(args.dump,
+                                                             args.posts))
+        report('tokenizer', results, args.output)
+        for text, nltkWords, fastWords in mismatches[:5]:
+            print('\nMismatch in:', text[:200])
+            print('  nltk:', nltkWords)
+            print('  fast:', fastWords)
+        if mismatches:
+            #a conformance failure, so scripts running the check notice it
+            sys.exit("%d of %d texts tokenized differently" % 
+                     (len(mismatches), results[0]['texts']))
+    elif args.command == 'rx':
+        results = benchRx(rxVocabulary(args.words))
+        report('rx', results, args.output)
+        different = [r['dictionary'] for r in results if not r['identical']]
+        if different:
+            sys.exit("The misspelling index matched differently for %s" % 
+                     ', '.join(different))
+    elif args.command == 'startup':
+        report('startup', benchStartup(args.repeat), args.output)
+    elif args.command == 'pipeline':
+        rca.tokenizerEngine = args.tokenizer
+        rca.lexiconPath = args.lexicon
+        report('pipeline', benchPipeline(args.rows, not args.no_memory, 
+                                         args.seed), args.output)
+    elif args.command == 'profiles':
+        report('profiles', benchProfiles(args.processes, args.authors,
+                                         args.posts), args.output)
+    else:
+        parser.print_help()